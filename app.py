@@ -1,5 +1,20 @@
+import time
+
+# Startup timing, reported by /ready.  Each checkpoint records the time
+# since the previous one, so together they cover the whole import.
+startup_times = {}
+_startup_mark = time.perf_counter()
+
+def startup_checkpoint(name):
+    """Record the time (ms) since the previous checkpoint under `name`."""
+    global _startup_mark
+    now = time.perf_counter()
+    startup_times[name] = round((now - _startup_mark) * 1000, 1)
+    _startup_mark = now
+
 import logging
-from flask import Flask, render_template, Response, request, jsonify
+from flask import Flask, render_template, Response, request, jsonify, g
+startup_checkpoint("import flask")
 import sys
 import io
 import math
@@ -7,119 +22,171 @@ from math import radians
 import os
 import random
 import numpy as np
-# This is needed for some reason...
-np.math = math
 import datetime
 import threading
-import time
-import tetra3
-from PIL import Image, ImageDraw, ImageFont
+from PIL import Image
 import ephem
 import configparser
-import csv
-import requests
+import json
+import asyncio
+import queue
+import socket
+import collections
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+startup_checkpoint("import numpy, PIL, ephem")
 import i2c
+import frames
+import framesource
+import boundaries
+import catalog
+import asyncserver
+import history
+import metrics
+import sky
+import solver
+import stellarium
+startup_checkpoint("import app modules")
+
+# Which subsystems are up, reported by /ready.  The solver (tetra3, its
+# database, the font and the catalogs) warms up in the background, so the
+# live view doesn't wait for it.
+# "solver" is tetra3 and its database; "font" and "solver catalogs" are what
+# the workers annotate solved fields with.  Why anything failed to load is
+# in startup_errors.
+subsystems_ready = {"catalog": False, "camera": False, "solver": False,
+                    "font": False, "solver catalogs": False, "i2c": False}
+startup_errors = {}
+
+# Solver subsystems, and the solver.warm_up() step that loads each
+SOLVER_SUBSYSTEMS = {"solver": "tetra3", "font": "font", "solver catalogs": "catalogs"}
 
 # Create a new ephem observer
 observer = ephem.Observer()
 
 # Load configuration from location.ini
-config = configparser.ConfigParser()
+# Allow `key = value  ; comment`, as in the README's examples
+config = configparser.ConfigParser(inline_comment_prefixes=(';', '#'))
 config.read('location.ini')
 
 # Set observer's location from the configuration file
 observer.lat = config.get('location', 'lat', fallback='0')
 observer.lon = config.get('location', 'lon', fallback='0')
 
-
-# libraries needed to solve for a "proper" WCS coordinate system
-
-from astropy import units as u
-from astropy.coordinates import SkyCoord
-from astropy.wcs.utils import fit_wcs_from_points  
-
-tetra = tetra3.Tetra3()
-
-font_path = "/usr/share/fonts/truetype/noto/NotoSansDisplay-Regular.ttf"
-font_size = 12
-font = ImageFont.truetype(font_path, font_size)
-
-
-
-
-# go ahead and load the ids...
-
-ids = { }
-with open("ids.csv", "r") as f:
-    rdr = csv.reader(f)
-    for a, b, c in rdr:
-        if b == '':
-            ids[int(a)] = c
-        else:
-            ids[int(a)] = b
-
-# not the most efficient, but... 
-
-def decode_simbad_greek(text):
-    greek_map = { 'alf': 'α',  # alpha
-                  'bet': 'β',  # beta
-                  'gam': 'γ',  # gamma 
-                  'del': 'δ',  # delta
-                  'eps': 'ε',  # epsilon
-                  'zet': 'ζ',  # zeta
-                  'eta': 'η',  # eta 
-                  'tet': 'θ',  # theta 
-                  'iot': 'ι',  # iota 
-                  'kap': 'κ',  # kappa 
-                  'lam': 'λ',  # lambda 
-                  'mu.': 'μ',  # mu 
-                  'nu.': 'ν',  # nu 
-                  'ksi': 'ξ',  # xi 
-                  'omi': 'ο',  # omicron 
-                  'pi.': 'π',  # pi 
-                  'rho': 'ρ',  # rho 
-                  'sig': 'σ',  # sigma 
-                  'tau': 'τ',  # tau 
-                  'ups': 'υ',  # upsilon 
-                  'phi': 'φ',  # phi 
-                  'chi': 'χ',  # chi 
-                  'psi': 'ψ',  # psi 
-                  'ome': 'ω',  # omega 
-          } 
-    result = text
-    for code, greek in greek_map.items(): 
-        result = result.replace(code, greek) 
-    return result
-
-constellation_boundaries = {}
-
-def load_constellation_boundaries():
-    """Load constellation boundaries from bound_20.dat."""
+# Make sure catalog.bin is up to date before the solver workers map it
+star_catalog = catalog.load()
+# Alt/az of every named star, for /api/visible and the solve results
+sky_index = sky.SkyIndex(math.degrees(observer.lat), math.degrees(observer.lon),
+                         star_catalog.ra, star_catalog.dec)
+subsystems_ready["catalog"] = True
+startup_checkpoint("catalog cache")
+
+# Plate solving runs in a pool of worker processes (see solver.py), so it
+# can use all of the Pi's cores.  The workers are forked right here, before
+# the camera is opened or any threads are started; each one loads its own
+# tetra3 database (see warm_up_solver()).  pipeline_depth bounds how many frames can be in the
+# solve/annotate pipeline at once.
+SOLVER_WORKERS = config.getint('solver', 'workers', fallback=3)
+SOLVER_PIPELINE_DEPTH = config.getint('solver', 'pipeline_depth', fallback=2)
+# Track from the last solution when we can, instead of solving blind
+tracking_mode = config.getboolean('solver', 'tracking', fallback=True)
+
+def start_solve_pool():
+    pool = ProcessPoolExecutor(max_workers=SOLVER_WORKERS,
+                               mp_context=multiprocessing.get_context('fork'))
+    pool.submit(int)  # forks all the workers now
+    return pool
+
+solve_pool = start_solve_pool()
+solve_pool_lock = threading.Lock()
+startup_checkpoint("solver pool")
+
+def restart_solve_pool(broken):
+    """Replace the pool after a worker died (the OOM killer, say).
+
+    A ProcessPoolExecutor is unusable once one of its workers is gone, so
+    without this every later solve would fail.  The new workers are forked
+    with our threads running, which is fine for the solver code they run.
+    """
+    global solve_pool
+    with solve_pool_lock:
+        if solve_pool is not broken:
+            return  # someone else already replaced it
+        print("A solver worker died; restarting the solver pool")
+        for name in SOLVER_SUBSYSTEMS:
+            subsystems_ready[name] = False
+        broken.shutdown(wait=False)
+        solve_pool = start_solve_pool()
+    threading.Thread(target=warm_up_solver, daemon=True).start()
+
+def warm_up_solver():
+    """Have every solver worker load tetra3, the font and the catalogs.
+
+    A step that failed in any worker leaves its subsystem not ready.
+    """
+    t0 = time.perf_counter()
+    reports = {}
+    errors = {}
     try:
-        with open("bound_20.dat", "r") as f:
-            for line in f:
-                ra_h = float(line[0:10])
-                dec_d = float(line[11:22])
-                constellation = line[23:27].strip()
-                
-                # Convert RA from hours to degrees
-                ra_d = ra_h * 15.0
-                
-                if constellation not in constellation_boundaries:
-                    constellation_boundaries[constellation] = []
-                
-                constellation_boundaries[constellation].append((ra_d, dec_d))
-    except FileNotFoundError:
-        print("Warning: bound_20.dat not found. Constellation boundaries will not be drawn.")
-
-def point_stellarium(ra_radians, dec_radians, stellarium_url="http://192.168.1.139:8090"):
-    endpoint = f"{stellarium_url}/api/main/view" 
-    x = math.cos(dec_radians) * math.cos(ra_radians)
-    y = math.cos(dec_radians) * math.sin(ra_radians)
-    z = math.sin(dec_radians)
-    params = { 'j2000' : str([ x, y, z ]) }
-    response = requests.post(endpoint, data=params)
-    return response.status_code == 200
+        # Loading takes seconds, so these land on different idle workers
+        futures = [solve_pool.submit(solver.warm_up) for _ in range(SOLVER_WORKERS)]
+    except Exception as e:
+        futures = []
+        errors["tetra3"] = f"solver pool: {e}"
+    for f in futures:
+        try:
+            pid, times, worker_errors = f.result()
+        except Exception as e:
+            errors["tetra3"] = f"solver worker failed: {e}"
+            continue
+        reports[pid] = times
+        errors.update(worker_errors)
+    startup_times["solver warm-up (background)"] = round((time.perf_counter() - t0) * 1000, 1)
+    # The per-step cost is much the same in every worker; report one
+    if reports:
+        for name, ms in next(iter(reports.values())).items():
+            startup_times[f"solver worker: {name}"] = ms
+    for name, step in SOLVER_SUBSYSTEMS.items():
+        subsystems_ready[name] = bool(reports) and step not in errors
+        if step in errors:
+            startup_errors[name] = errors[step]
+        else:
+            startup_errors.pop(name, None)
+    print_startup_report()
+
+# Each I2C peripheral is read in the background this many times a second,
+# and /api/i2c answers from the last `history` readings.  With a rate of 0
+# they are read on demand instead.
+I2C_SAMPLE_RATE = config.getfloat('i2c', 'sample_rate', fallback=i2c.SAMPLE_RATE)
+I2C_SAMPLE_HISTORY = config.getint('i2c', 'history', fallback=i2c.SAMPLE_HISTORY)
+
+def init_i2c():
+    """Detect the I2C peripherals and start sampling them."""
+    t0 = time.perf_counter()
+    i2c.init_peripherals()
+    if I2C_SAMPLE_RATE > 0:
+        i2c.start_samplers(I2C_SAMPLE_RATE, I2C_SAMPLE_HISTORY)
+    startup_times["i2c (background)"] = round((time.perf_counter() - t0) * 1000, 1)
+    subsystems_ready["i2c"] = True
+
+def print_startup_report():
+    print("Startup times (ms):")
+    for name, ms in startup_times.items():
+        print(f"  {name:40s} {ms:10.1f}")
+    for name, error in startup_errors.items():
+        print(f"  {name} failed to load: {error}")
+
+
+# Point Stellarium at each solved field when [stellarium] url is set (see
+# stellarium.py); pushes happen in the background, so solving never waits
+STELLARIUM_URL = config.get('stellarium', 'url', fallback='')
+stellarium_publisher = None
+if STELLARIUM_URL:
+    stellarium_publisher = stellarium.StellariumPublisher(
+        STELLARIUM_URL,
+        max_rate=config.getfloat('stellarium', 'max_rate', fallback=2.0),
+        timeout=config.getfloat('stellarium', 'timeout', fallback=1.0))
 
 def format_radec_fixed_width(angle_obj, is_ra=True, total_width=10, decimal_places=1):
     """
@@ -155,9 +222,6 @@ def format_radec_fixed_width(angle_obj, is_ra=True, total_width=10, decimal_plac
     
     return formatted_time.ljust(total_width)[:total_width]
 
-from picamera2 import Picamera2
-
-
 app = Flask(__name__)
 
 import atexit
@@ -179,70 +243,146 @@ def toggle_pause():
     """Toggle the paused state."""
     global is_paused
     is_paused = not is_paused
+    notify_status_change()
     return jsonify({"is_paused": is_paused})
 
-# Global variables for video feed and FPS
-latest_frame_bytes = None
-current_fps = 0
-last_frame_time = time.time()
-frame_count = 0
-solve_fps = 0
-last_solve_time = time.time()
-solve_count = 0
-solve_completed_count = 0
-
-def calculate_solve_fps():
-    """Continuously calculates the solve FPS."""
-    global solve_fps, solve_completed_count
+# Every lores frame goes through this ring; the capture thread is the only
+# code that reads from the camera's lores stream.
+frame_ring = frames.FrameRing(slots=4)
+
+# Instrumentation, served at /metrics (see metrics.py).  The FPS figures
+# in the UI are rates of the frame and solve counters.
+frames_captured = metrics.Counter("findr_frames_captured_total", "Frames captured from the camera")
+capture_errors = metrics.Counter("findr_capture_errors_total", "Errors in the capture loop")
+capture_interval = metrics.Histogram("findr_capture_interval_seconds", "Time between captured frames")
+frame_age = metrics.Histogram("findr_frame_age_seconds",
+                              "Time since the sensor captured a frame, when it was captured, "
+                              "went into a solve, or had its solve published", ["at"])
+jpeg_encode_time = metrics.Histogram("findr_jpeg_encode_seconds", "Time to JPEG-encode an image", ["kind"])
+jpeg_size = metrics.Histogram("findr_jpeg_bytes", "Size of encoded JPEGs", ["kind"],
+                              buckets=(8192, 16384, 32768, 65536, 131072, 262144, 524288, 1048576))
+solve_results = metrics.Counter("findr_solves_total", "Completed solves, by result", ["result"])
+frames_skipped = metrics.Counter("findr_auto_solve_skipped_frames_total",
+                                 "Frames captured while auto-solving that were never solved, "
+                                 "because a newer one was taken instead")
+solve_stage_time = metrics.Histogram("findr_solve_stage_seconds",
+                                     "Time spent in each solve stage (extract, match or track, "
+                                     "total from start to publish, and render)", ["stage"])
+http_request_time = metrics.Histogram("findr_http_request_seconds",
+                                      "Time to handle HTTP requests; for streams, until the "
+                                      "response starts", ["endpoint"])
+http_responses = metrics.Counter("findr_http_responses_total", "HTTP responses", ["endpoint", "code"])
+
+# Id of the current/most recent solve; only the solver worker changes it
+solve_id = 0
+
+# Status events.  Whatever changes something the UI displays calls
+# notify_status_change(); /events clients then rebuild the snapshot and
+# only send it if it differs from the last one they sent.
+status_version = 0
+status_condition = threading.Condition()
+latest_system_stats = {"cpu_temp": "N/A", "cpu_load": "N/A"}
+
+def notify_status_change():
+    """Wake up the /events clients."""
+    global status_version
+    with status_condition:
+        status_version += 1
+        status_condition.notify_all()
+
+def get_status_snapshot():
+    """Return everything the UI shows about the server as one dict."""
+    status = {
+        "fps": f"{frames_captured.rate(2):.1f}",
+        "solve_fps": f"{solve_results.rate(5):.1f}",
+        "is_paused": is_paused,
+        "solver_status": solver_status,
+        "solve_id": solve_id,
+        "auto_solve": auto_solve,
+        "auto_solve_rate": auto_solve_rate,
+        "skipped_frames": frames_skipped.value,
+        **latest_system_stats,
+    }
+    if solver_status == "solved" or solver_status == "failed":
+        status["solver_result"] = solver_result
+    return status
+
+def read_system_stats():
+    """Read the CPU temperature and load average."""
+    try:
+        with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
+            temp = f"{int(f.read().strip()) / 1000.0:.1f}"
+    except (IOError, ValueError):
+        temp = 'N/A'
+
+    try:
+        with open('/proc/loadavg', 'r') as f:
+            load = f.read().split()[0]
+    except IOError:
+        load = 'N/A'
+
+    return {"cpu_temp": temp, "cpu_load": load}
+
+def monitor_system_stats():
+    """Sample the system stats in the background.
+
+    Also wakes the /events clients every 5 s, so rates like the solve FPS
+    go back down when nothing else is happening.
+    """
+    global latest_system_stats
     while True:
+        latest_system_stats = read_system_stats()
+        notify_status_change()
         time.sleep(5)
-        solve_fps = solve_completed_count / 5.0
-        solve_completed_count = 0
 
 
 
 
 
 def capture_and_process_frames():
-    """Continuously captures frames, calculates FPS, and stores the latest frame."""
-    global latest_frame_bytes, current_fps, last_frame_time, frame_count, is_paused
+    """Continuously captures frames into the ring, and counts them."""
+    last_capture = None
+    last_notify = 0
     while True:
         if is_paused:
             time.sleep(0.1)
             continue
         try:
-            buffer = io.BytesIO()
-            camera.capture_file(buffer, name='lores', format='jpeg')
-            frame = buffer.getvalue()
-
-            latest_frame_bytes = frame
-
-            frame_count += 1
-            current_time = time.time()
-            elapsed_time = current_time - last_frame_time
-
-            # Debug prints for frame count and elapsed time
-            # print(f"Frame count: {frame_count}, Elapsed time: {elapsed_time:.2f}s")
-
-            if elapsed_time >= 1.0: # Update FPS every second
-                current_fps = frame_count / elapsed_time
-                frame_count = 0
-                last_frame_time = current_time
+            with camera.capture() as (array, metadata):
+                with jpeg_encode_time.labels(kind="live").time():
+                    jpegs = frames.encode_tiers(array, LORES_SIZE, frame_ring.wanted_tiers())
+                frame_ring.write(array, metadata, jpegs)
+
+            now = time.monotonic()
+            frames_captured.inc()
+            for tier, jpeg in jpegs.items():
+                jpeg_size.labels(kind=tier).observe(len(jpeg))
+            age = frames.frame_age(metadata.get("SensorTimestamp"))
+            if age is not None:
+                frame_age.labels(at="capture").observe(age)
+            if last_capture is not None:
+                capture_interval.observe(now - last_capture)
+            last_capture = now
+
+            if now - last_notify >= 1.0: # Update the FPS display every second
+                last_notify = now
+                notify_status_change()
             time.sleep(0.01) # Small delay to prevent busy-waiting
         except Exception as e:
+            capture_errors.inc()
             print(f"Error capturing frame: {e}")
-            # Optionally, you might want to set latest_frame_bytes to a placeholder
+            # Optionally, you might want to publish a placeholder frame
             # or handle the error in a way that doesn't crash the thread.
             time.sleep(1) # Wait a bit before retrying to avoid spamming errors
 
-# Start the frame capture and processing in a separate thread
-frame_capture_thread = threading.Thread(target=capture_and_process_frames)
-frame_capture_thread.daemon = True
-frame_capture_thread.start()
-
-# In-memory storage for the solved image bytes to avoid writing to disk.
-# Access guarded by solved_image_lock.
-solved_image_bytes = None
+# The newest solved frame as (solve_id, image, solution).  Nothing is drawn
+# until /solved_field.jpg is asked for; the JPEGs it renders are cached per
+# (solve_id, overlays), and renders in progress are shared through
+# solved_field_renders.  All guarded by solved_image_lock.
+solved_frame = None
+solved_field_cache = collections.OrderedDict()
+solved_field_renders = {}
+SOLVED_FIELD_CACHE_SIZE = 8
 solved_image_lock = threading.Lock()
 
 def format_radec_fixed_width(angle_obj, is_ra=True, total_width=10, decimal_places=1):
@@ -279,203 +419,279 @@ def format_radec_fixed_width(angle_obj, is_ra=True, total_width=10, decimal_plac
     
     return formatted_time.ljust(total_width)[:total_width]
 
-def solve_plate():
-    """Capture an image and solve for RA/Dec/Roll."""
-    global solver_status, solver_result, test_mode, solved_image_bytes, is_paused
+def load_solve_image():
+    """Get the next image to solve.
+
+    Returns (image, luminance, frame_info): the image to draw the result on,
+    its 2D luminance for the solver, and where it came from.
+    """
+    if test_mode:
+        # For testing, load from a local file instead of capturing from camera
+        test_images_dir = "test-images"
+        image_files = [f for f in os.listdir(test_images_dir) if f.lower().endswith(('.jpg', '.jpeg'))]
+        if not image_files:
+            raise RuntimeError("No test images found.")
+        random_image_file = random.choice(image_files)
+        image_path = os.path.join(test_images_dir, random_image_file)
+        img = Image.open(image_path)
+        return np.asarray(img.convert('RGB')), np.asarray(img.convert('L')), {"test_image": random_image_file}
+
+    # Solve the newest frame from the capture ring, straight from the lores
+    # Y plane.  The worker process gets its own copy, so we can unpin the
+    # slot as soon as we have taken it.  If the newest frame has already
+    # been solved, wait (up to a second) for the next one.
+    frame_ring.wait_for_frame(last_solved_seq, timeout=1.0)
+    with frame_ring.latest() as frame:
+        if frame is None:
+            raise RuntimeError("No frame captured yet.")
+        luminance = frame.luminance(LORES_SIZE).copy()
+        frame_info = {
+            "frame_seq": frame.seq,
+            "sensor_timestamp": frame.timestamp,
+            "exposure_time": frame.exposure_time,
+            "analogue_gain": frame.analogue_gain,
+        }
+    return luminance, luminance, frame_info
+
+# Every solve result, for charting a night's pointing (see history.py)
+solve_history = history.SolveHistory(config.getint('history', 'capacity', fallback=50000))
+
+# Solve id of the newest published result.  Solves can finish out of order
+# when the pipeline is deeper than one, so older results never replace
+# newer ones.  Guarded by solved_image_lock.
+published_solve_id = 0
+
+# What the next solve can track from: the FOV and matches of the newest
+# successful solve.  Guarded by solved_image_lock.
+tracking_seed = None
+
+# Bounds the number of frames being solved at once
+solve_pipeline = threading.BoundedSemaphore(SOLVER_PIPELINE_DEPTH)
+
+# Frame seq of the newest frame sent to the solver, and of the previous
+# auto solve.  Only the solver worker changes them, except that turning
+# auto-solve on resets last_auto_seq to None.
+last_solved_seq = None
+last_auto_seq = None
+
+def start_solve(auto=False):
+    """Send the newest frame into the solve pipeline.
+
+    `auto` solves come from auto_solver(), and count the frames they skip.
+    """
+    global solver_status, solve_id, last_solved_seq, last_auto_seq
     if is_paused:
         solver_status = "paused"
+        notify_status_change()
         return
-    img = None
+    solve_pipeline.acquire()
+    solve_id += 1
+    this_solve_id = solve_id
+    solver_status = "solving"
+    notify_status_change()
+    started = time.perf_counter()
     try:
-        if test_mode:
-            # For testing, load from a local file instead of capturing from camera
-            test_images_dir = "test-images"
-            image_files = [f for f in os.listdir(test_images_dir) if f.lower().endswith(('.jpg', '.jpeg'))]
-            if not image_files:
-                solver_status = "failed"
-                solver_result = {"error": "No test images found."}
-                return
-            random_image_file = random.choice(image_files)
-            image_path = os.path.join(test_images_dir, random_image_file)
-            img = Image.open(image_path)
-        else:
-            # Capture from Picamera
-            buffer = io.BytesIO()
-            camera.capture_file(buffer, name='lores', format='jpeg')
-            buffer.seek(0)
-            img = Image.open(buffer)
-
-        solution = tetra.solve_from_image(img,
-                return_visual=True, return_matches=True,
-                distortion=-0.003857906866170312)
-
-        if solution and 'RA' in solution and 'Dec' in solution and 'Roll' in solution:
-            # Get the visual solution
-            visual_solution = solution['visual']
-
-            # Convert both images to numpy arrays
-            img_array = np.array(img.convert('RGB'))
-            visual_array = np.array(visual_solution.convert('RGB'))
-
-            # Resize visual solution to match input image dimensions
-            if img_array.shape != visual_array.shape:
-                visual_solution_resized = visual_solution.resize(img.size)
-                visual_array = np.array(visual_solution_resized.convert('RGB'))
-                visual_solution = visual_solution_resized
-
-            # Combine the images by taking the maximum pixel value
-            combined_array = np.maximum(img_array, visual_array)
-
-            # Create a new image from the combined array
-            combined_image = Image.fromarray(combined_array)
-
-            # okay, MTV - draw annotations
-            draw = ImageDraw.Draw(combined_image)
-            for id, p in zip(solution.get("matched_catID", []), solution.get("matched_centroids", [])):
-                try:
-                    # not sure why x and y are swapped here...
-                    p = (int(p[1]) + 8, int(p[0]) - 8)
-                    id_str = decode_simbad_greek(ids.get(id, str(id)))
-                    id_fields = id_str.split()
-                    if id_fields and id_fields[0] == "*":
-                        id_str = ' '.join(id_fields[1:])
-                    draw.text(p, f"{id_str}", fill=(255,255,255), font=font)
-                except Exception:
-                    pass
-
-            # Build solver_result
-            solution_time_val = solution.get("T_solve", 0.0)
-            ra_hms = ephem.hours(radians(solution['RA']))
-            dec_dms = ephem.degrees(radians(solution['Dec']))
-
-            # now we can compute the alt/az for the solved center.
-            observer.date = ephem.now()
-            target = ephem.FixedBody()
-            target._ra = ra_hms
-            target._dec = dec_dms
-            target.compute(observer)
-            
-            solver_result = {
-                "ra": f"{solution['RA']:.4f}",
-                "dec": f"{solution['Dec']:.4f}",
-                "roll": f"{solution['Roll']:.4f}",
-                "ra_hms": format_radec_fixed_width(ra_hms, is_ra=True, total_width=10, decimal_places=1),
-                "dec_dms": format_radec_fixed_width(dec_dms, is_ra=False, total_width=11, decimal_places=1),
-                "alt": f"{math.degrees(target.alt):.1f}",
-                "az": f"{math.degrees(target.az):.1f}",
-                "solved_image_url": "/solved_field.jpg",
-                "solution_time": f"{solution_time_val:.2f}ms",
-                "constellation": ephem.constellation((radians(solution['RA']), radians(solution['Dec'])))[0],
-                "matched_stars_count": len(solution.get("matched_catID", [])),
-            }
-
-            solver_status = "solved"
-
-            # MTV here is some magic... 
-            # We asked for the solver to return the list of matched stars.
-            # The data will include both the RA/DEC (in degrees) for each 
-            # of the stars, as well as the RA/DEC.   Using the two, we 
-            # can ask astropy to compute an appropriate conversion object,
-            # including the possibility of adding the distortion parameter.
+        image, luminance, frame_info = load_solve_image()
+        seq = frame_info.get("frame_seq")
+        if seq is not None:
+            last_solved_seq = seq
+            if auto:
+                if last_auto_seq is not None and seq - last_auto_seq > 1:
+                    frames_skipped.inc(seq - last_auto_seq - 1)
+                last_auto_seq = seq
+        age = frames.frame_age(frame_info.get("sensor_timestamp"))
+        if age is not None:
+            frame_age.labels(at="solve").observe(age)
+        seed = tracking_seed if tracking_mode else None
+        pool = solve_pool
+        try:
+            future = pool.submit(solver.solve_frame, luminance, seed)
+        except BrokenProcessPool:
+            restart_solve_pool(pool)
+            pool = solve_pool
+            future = pool.submit(solver.solve_frame, luminance, seed)
+    except Exception as e:
+        publish_solution(this_solve_id, None, {"error": str(e)}, started=started)
+        solve_pipeline.release()
+        return
+    # The callback runs on the pool's own thread, which has the other
+    # workers' results to collect, so it only hands this one on
+    future.add_done_callback(
+        lambda f: solved_frames.put((this_solve_id, image, frame_info, started, pool, f)))
 
-            try:
+# Finished solves, waiting for solve_publisher()
+solved_frames = queue.Queue()
 
-                matched_stars = np.array(solution["matched_stars"])
-                matched_centroids = np.array(solution["matched_centroids"])
-
-                # x is returned as the second column by tetra3
-                # y is the first column
-
-                star_x = matched_centroids[:,1]
-                star_y = matched_centroids[:,0]
-                star_xy = (star_x, star_y)
-
-                star_ra = np.array(matched_stars[:,0]) * u.deg
-                star_dec = np.array(matched_stars[:,1]) * u.deg
-
-                world_coords = SkyCoord(ra = star_ra, dec = star_dec, frame = 'icrs')
-
-                # now, fit the model.. 
-                wcs = fit_wcs_from_points(
-                    star_xy,
-                    world_coords, 
-                    projection='TAN',
-                    sip_degree=2)
-
-                # Draw constellation boundaries
-                constellation_name = solver_result.get("constellation").upper()
-                if constellation_name and constellation_name in constellation_boundaries:
-                    points = constellation_boundaries[constellation_name]
-                    # we need to transform the points to pixel coordinates
-                    pixel_points = []
-                    for ra, dec in points:
-                        try:
-                            px, py = wcs.world_to_pixel(SkyCoord(ra, dec, unit="deg"))
-                            pixel_points.append((px, py))
-                        except Exception as e:
-                            print(f"Error converting point to pixel: {e}")
-                            pixel_points.append(None)
-                    
-                    # Draw lines between consecutive points
-                    for i in range(len(pixel_points) - 1):
-                        p1 = pixel_points[i]
-                        p2 = pixel_points[i+1]
-                        # relies on clipping from the ImageDraw library...
-                        draw.line([p1, p2], fill="yellow", width=1)
-
-            except Exception as e:
-                print(f"EXCEPTION DURING WCS HANDLING: {e}")
-
-            # now that we have modified the image, we must re-save it
-            # before we return.
-            #
-            # Save the combined image into memory (JPEG)
-            buf = io.BytesIO()
-            combined_image.save(buf, format='JPEG')
-            buf.seek(0)
-            with solved_image_lock:
-                solved_image_bytes = buf.getvalue()
+def solve_publisher():
+    """Publish finished solves, in the order they finish."""
+    while True:
+        frame_solved(*solved_frames.get())
 
-            # send the center to stellarium...
-            if False:
-                point_stellarium(radians(solution['RA']), radians(solution['Dec']))
+def frame_solved(this_solve_id, image, frame_info, started, pool, future):
+    """The solve is done: publish the result and keep the frame for drawing."""
+    try:
+        solution = future.result()
+    except BrokenProcessPool:
+        restart_solve_pool(pool)
+        solution = None
+    except Exception as e:
+        print(f"Error solving frame: {e}")
+        solution = None
+    try:
+        publish_solution(this_solve_id, solution, frame_info, image, started)
+    except Exception as e:
+        print(f"Error publishing solve: {e}")
+    finally:
+        solve_pipeline.release()
 
-        else:
-            # Save the original input image into memory so the UI can still display something
-            buf = io.BytesIO()
-            img.save(buf, format='JPEG')
-            buf.seek(0)
-            with solved_image_lock:
-                solved_image_bytes = buf.getvalue()
+def publish_solution(this_solve_id, solution, frame_info, image=None, started=None):
+    """Turn a tetra3 solution into solver_result, unless a newer one is out.
 
-            solver_status = "failed"
-            solver_result = {"solved_image_url": "/solved_field.jpg"}
+    Every result, newer or not, also goes into solve_history.
+    """
+    global solver_status, solver_result, published_solve_id, solved_frame, tracking_seed
+    if solver.is_solved(solution):
+        # Build solver_result
+        solution_time_val = solution.get("T_solve", 0.0)
+        ra_hms = ephem.hours(radians(solution['RA']))
+        dec_dms = ephem.degrees(radians(solution['Dec']))
+
+        # now we can compute the alt/az for the solved center.
+        alt, az, _ = sky_index.horizontal(solution['RA'], solution['Dec'])
+
+        result = {
+            "ra": f"{solution['RA']:.4f}",
+            "dec": f"{solution['Dec']:.4f}",
+            "roll": f"{solution['Roll']:.4f}",
+            "ra_hms": format_radec_fixed_width(ra_hms, is_ra=True, total_width=10, decimal_places=1),
+            "dec_dms": format_radec_fixed_width(dec_dms, is_ra=False, total_width=11, decimal_places=1),
+            "alt": f"{alt:.1f}",
+            "az": f"{az:.1f}",
+            "solved_image_url": "/solved_field.jpg",
+            "solution_time": f"{solution_time_val:.2f}ms",
+            "constellation": ephem.constellation((radians(solution['RA']), radians(solution['Dec'])))[0],
+            "matched_stars_count": len(solution.get("matched_stars") or []),
+            "tracked": bool(solution.get("tracked")),
+            "solve_id": this_solve_id,
+            **frame_info,
+        }
+        status = "solved"
+
+        # send the center to stellarium...
+        if stellarium_publisher is not None:
+            stellarium_publisher.publish(radians(solution['RA']), radians(solution['Dec']))
+    else:
+        result = {"solved_image_url": "/solved_field.jpg", "solve_id": this_solve_id, **frame_info}
+        status = "failed"
+        alt = az = None
+
+    solution = solution or {}
+    solve_history.append(
+        solve_id=this_solve_id, time=time.time(),
+        solved=status == "solved", tracked=bool(solution.get("tracked")),
+        ra=solution.get("RA"), dec=solution.get("Dec"), roll=solution.get("Roll"),
+        fov=solution.get("FOV"), alt=alt, az=az,
+        matches=len(solution.get("matched_stars") or []),
+        frame_seq=frame_info.get("frame_seq", 0),
+        t_extract=solution.get("T_extract", 0.0), t_solve=solution.get("T_solve", 0.0),
+        t_total=(time.perf_counter() - started) * 1000 if started else 0.0)
+
+    solve_results.labels(result=status).inc()
+    if "T_extract" in solution:
+        solve_stage_time.labels(stage="extract").observe(solution["T_extract"] / 1000)
+    if solution.get("T_solve") is not None:
+        stage = "track" if solution.get("tracked") else "match"
+        solve_stage_time.labels(stage=stage).observe(solution["T_solve"] / 1000)
+    if started:
+        solve_stage_time.labels(stage="total").observe(time.perf_counter() - started)
+    age = frames.frame_age(frame_info.get("sensor_timestamp"))
+    if age is not None:
+        frame_age.labels(at="published").observe(age)
+    with solved_image_lock:
+        if this_solve_id > published_solve_id:
+            published_solve_id = this_solve_id
+            solver_result = result
+            solver_status = status
+            if image is not None:
+                solved_frame = (this_solve_id, image, solution)
+            if status == "solved":
+                tracking_seed = {key: solution.get(key) for key in
+                                 ("FOV", "distortion", "matched_centroids", "matched_stars")}
+    notify_status_change()
+
+# Solve requests go through a queue of depth 1 to one long-lived worker.
+# Requests that arrive while one is already waiting are merged into it, and
+# each solve takes whatever frame is newest when it starts.
+solve_requests = queue.Queue(maxsize=1)
+
+def request_solve():
+    """Queue a solve, unless one is already waiting."""
+    try:
+        solve_requests.put_nowait(True)
+    except queue.Full:
+        pass
 
-    except Exception as e:
-        if img:
-            try:
-                buf = io.BytesIO()
-                img.save(buf, format='JPEG')
-                buf.seek(0)
-                with solved_image_lock:
-                    solved_image_bytes = buf.getvalue()
-            except Exception:
-                pass
-        solver_status = "failed"
-        solver_result = {"solved_image_url": "/solved_field.jpg"}
-    finally:
-        global solve_completed_count
-        solve_completed_count += 1
+def solver_worker():
+    """Feed queued solves into the pipeline as it has room for them."""
+    while True:
+        start_solve(auto=solve_requests.get() == "auto")
+
+# Continuous solving is driven from here, not by the browser, so it keeps
+# its rate with no tab open (or several).  [solver] auto_solve turns it on
+# at startup; auto_solve_rate is solves per second, 0 for as fast as the
+# pipeline goes.
+auto_solve = config.getboolean('solver', 'auto_solve', fallback=False)
+auto_solve_rate = config.getfloat('solver', 'auto_solve_rate', fallback=0.0)
+auto_solve_changed = threading.Event()
+
+def auto_solver():
+    """Queue a solve every 1/auto_solve_rate seconds while auto_solve is on.
+
+    Queueing waits while a request is already waiting, so with no rate set
+    (or one the solver can't keep up with) solves go back to back.
+    """
+    next_time = 0.0
+    while True:
+        if not auto_solve or is_paused:
+            auto_solve_changed.wait(1.0)
+            auto_solve_changed.clear()
+            continue
+        now = time.monotonic()
+        if auto_solve_rate > 0 and now < next_time:
+            auto_solve_changed.wait(next_time - now)
+            auto_solve_changed.clear()
+            continue
+        interval = 1.0 / auto_solve_rate if auto_solve_rate > 0 else 0.0
+        next_time = max(next_time + interval, now)
+        solve_requests.put("auto")
 
 @app.route('/solve', methods=['POST'])
 def solve():
-    """Initiate plate solving in a background thread."""
-    global solver_status
-    solver_status = "solving"
-    solver_thread = threading.Thread(target=solve_plate)
-    solver_thread.start()
+    """Ask the solver worker for a solve of the newest frame."""
+    request_solve()
     return jsonify({"status": "solving"})
 
+@app.route('/set_auto_solve', methods=['POST'])
+def set_auto_solve():
+    """Turn auto-solve on or off, and/or set its rate (solves/s, 0 = flat out)."""
+    global auto_solve, auto_solve_rate, last_auto_seq
+    data = request.json
+    if 'auto_solve' in data:
+        if data['auto_solve'] and not auto_solve:
+            last_auto_seq = None
+        auto_solve = bool(data['auto_solve'])
+    if 'rate' in data:
+        auto_solve_rate = max(float(data['rate']), 0.0)
+    auto_solve_changed.set()
+    notify_status_change()
+    return "", 204
+
+@app.route('/get_auto_solve')
+def get_auto_solve():
+    """Return the auto-solve settings, the achieved solve rate and skipped frames."""
+    return jsonify(auto_solve=auto_solve, target_rate=auto_solve_rate,
+                   rate=round(solve_results.rate(5), 2), skipped_frames=frames_skipped.value)
+
 @app.route('/solve_status')
 def get_solve_status():
     """Return the status of the plate solver."""
@@ -488,19 +704,71 @@ def get_solve_status():
 @app.route('/system-stats')
 def system_stats():
     """Return system stats as JSON."""
-    try:
-        with open('/sys/class/thermal/thermal_zone0/temp', 'r') as f:
-            temp = int(f.read().strip()) / 1000.0
-    except IOError:
-        temp = 'N/A'
+    return jsonify(**read_system_stats())
 
-    try:
-        with open('/proc/loadavg', 'r') as f:
-            load = f.read().split()[0]
-    except IOError:
-        load = 'N/A'
+def wait_for_status_change(seen_version, timeout=None):
+    """Wait until status_version is not seen_version; returns the new version.
 
-    return jsonify(cpu_temp=f"{temp:.1f}", cpu_load=load)
+    On timeout, returns seen_version.
+    """
+    with status_condition:
+        status_condition.wait_for(lambda: status_version != seen_version, timeout=timeout)
+        return status_version
+
+def generate_status_events():
+    """Yield a server-sent event whenever the status snapshot changes."""
+    seen_version = None
+    last_status = None
+    while True:
+        version = wait_for_status_change(seen_version, timeout=15.0)
+        changed = version != seen_version
+        seen_version = version
+        status = get_status_snapshot()
+        if status != last_status:
+            last_status = status
+            yield f"data: {json.dumps(status)}\n\n"
+        elif not changed:
+            # SSE comment line; keeps proxies happy and detects dead clients
+            yield ": keep-alive\n\n"
+
+@app.route('/events')
+def events():
+    """Stream status changes (FPS, pause, solver, system stats) as server-sent events."""
+    return Response(generate_status_events(), mimetype='text/event-stream',
+                    headers={"Cache-Control": "no-cache"})
+
+def generate_solve_records(after_id, follow):
+    """Yield solve history records newer than after_id as JSON lines."""
+    while True:
+        records = solve_history.since(after_id)
+        if len(records):
+            after_id = int(records["id"][-1])
+            yield history.to_json_lines(records)
+        if not follow:
+            return
+        if solve_history.wait(after_id, timeout=15.0) == after_id:
+            # blank line keeps the connection alive between solves
+            yield "\n"
+
+@app.route('/api/solves')
+def solves():
+    """Solve history as JSON lines, from record ?since=<id> (default all).
+
+    With ?follow=1 the response stays open and new solves are streamed as
+    they are published.
+    """
+    after_id = request.args.get('since', 0, type=int)
+    follow = request.args.get('follow', '0') not in ('0', 'false', '')
+    return Response(generate_solve_records(after_id, follow), mimetype='application/x-ndjson',
+                    headers={"Cache-Control": "no-cache"})
+
+@app.route('/api/solves.npy')
+def solves_export():
+    """Solve history from record ?since=<id> as a NumPy .npy file (see history.RECORD)."""
+    buf = io.BytesIO()
+    np.save(buf, solve_history.since(request.args.get('since', 0, type=int)))
+    return Response(buf.getvalue(), mimetype='application/octet-stream',
+                    headers={"Content-Disposition": "attachment; filename=solves.npy"})
 
 @app.route('/set_test_mode', methods=['POST'])
 def set_test_mode():
@@ -510,23 +778,25 @@ def set_test_mode():
     test_mode = data.get('test_mode', False)
     return "", 204
 
-camera = Picamera2()
-
-# Initialize camera and set initial controls once
-config = camera.create_still_configuration(
-    main = {
-        "size" : (1456, 1088),
-        "format" : "RGB888"
-        },
-    lores = {
-        "size" : (640, 480),
-        "format" : "YUV420",
-        },
-        )
+@app.route('/set_tracking_mode', methods=['POST'])
+def set_tracking_mode():
+    """Turn solving by tracking from the last solution on or off."""
+    global tracking_mode
+    data = request.json
+    tracking_mode = data.get('tracking_mode', False)
+    return "", 204
 
-camera.configure(config)
-camera.start()
+# The camera, or a replay of recorded frames (see framesource.py):
+#   [camera]
+#   source = auto          ; picamera2, replay, or auto (replay without Picamera2)
+#   replay = test-images   ; a directory of images or a recorded .npz
+#   replay_fps = 10
+camera = framesource.open_source(config.get('camera', 'source', fallback='auto'),
+                                 replay_path=config.get('camera', 'replay', fallback='test-images'),
+                                 replay_fps=config.getfloat('camera', 'replay_fps', fallback=10.0))
 
+# The lores stream feeds the live view and the solver
+LORES_SIZE = framesource.LORES_SIZE
 
 
 # Set initial controls safely
@@ -548,18 +818,25 @@ def safe_set_controls(controls):
         camera.set_controls(safe_controls)
 
 safe_set_controls(initial_controls)
+subsystems_ready["camera"] = True
+startup_checkpoint("camera")
+
+# Start the frame capture and processing in a separate thread
+frame_capture_thread = threading.Thread(target=capture_and_process_frames)
+frame_capture_thread.daemon = True
+frame_capture_thread.start()
 
 
 
 @app.route('/get_fps')
 def get_fps():
     """Return the current FPS."""
-    return jsonify(fps=f"{current_fps:.1f}")
+    return jsonify(fps=f"{frames_captured.rate(2):.1f}")
 
 @app.route('/get_solve_fps')
 def get_solve_fps():
     """Return the current solve FPS."""
-    return jsonify(fps=f"{solve_fps:.1f}")
+    return jsonify(fps=f"{solve_results.rate(5):.1f}")
 
 @app.route('/get_pause_state')
 def get_pause_state():
@@ -572,23 +849,23 @@ def index():
     """Return the main page with initial slider values."""
     global test_mode
     # Get camera properties
-    camera_properties = camera.camera_properties
+    camera_properties = camera.properties
     model = camera_properties.get("Model", "Unknown")
     pixel_array_size = camera_properties.get("PixelArraySize", "Unknown")
 
     # Get current camera controls
-    current_controls = camera.controls
+    current_controls = camera.controls()
 
     # Map current camera values to slider values (0-100)
     slider_values = {}
 
     # AnalogueGain
-    current_gain = getattr(current_controls, "AnalogueGain", 1.0)
+    current_gain = current_controls.get("AnalogueGain", 1.0)
     slider_values['gain'] = int(current_gain)
 
     # ExposureTime
     exposure_times = [1000, 2000, 4000, 8000, 16000, 32000, 64000, 125000, 250000, 500000, 1000000]
-    current_exposure = getattr(current_controls, "ExposureTime", 10000)
+    current_exposure = current_controls.get("ExposureTime", 10000)
     # Find the index of the closest exposure time
     exposure_index = min(range(len(exposure_times)), key=lambda i: abs(exposure_times[i] - current_exposure))
     slider_values['exposure_index'] = exposure_index
@@ -596,45 +873,150 @@ def index():
 
     # Brightness
     min_bright, max_bright, _ = camera.camera_controls.get("Brightness", (-1.0, 1.0, 0.0))
-    current_brightness = getattr(current_controls, "Brightness", 0.0)
+    current_brightness = current_controls.get("Brightness", 0.0)
     slider_values['brightness'] = int(((current_brightness - min_bright) / (max_bright - min_bright)) * 100) if (max_bright - min_bright) != 0 else 0
 
     # Contrast
     min_contrast, max_contrast, _ = camera.camera_controls.get("Contrast", (0.0, 32.0, 1.0))
-    current_contrast = getattr(current_controls, "Contrast", 1.0)
+    current_contrast = current_controls.get("Contrast", 1.0)
     slider_values['contrast'] = int(((current_contrast - min_contrast) / (max_contrast - min_contrast)) * 100) if (max_contrast - min_contrast) != 0 else 0
 
     # Sharpness
     min_sharp, max_sharp, _ = camera.camera_controls.get("Sharpness", (0.0, 16.0, 1.0))
-    current_sharpness = getattr(current_controls, "Sharpness", 1.0)
+    current_sharpness = current_controls.get("Sharpness", 1.0)
     slider_values['sharpness'] = int(((current_sharpness - min_sharp) / (max_sharp - min_sharp)) * 100) if (max_sharp - min_sharp) != 0 else 0
 
 
 
-    return render_template('index.html', model=model, pixel_array_size=pixel_array_size, test_mode=test_mode, **slider_values)
+    return render_template('index.html', model=model, pixel_array_size=pixel_array_size, test_mode=test_mode, tracking_mode=tracking_mode, auto_solve=auto_solve, auto_solve_rate=auto_solve_rate, **slider_values)
+
+# How long an adaptive /stream client may take to receive one frame before
+# it is moved to a smaller tier: 0.2 s keeps weak links at about 5 fps.
+STREAM_FRAME_BUDGET = config.getfloat('stream', 'frame_budget', fallback=0.2)
+
+def parse_tier(arg, default="full", allow_auto=False):
+    """Turn ?tier= into one of frames.TIERS (or "auto"), or None if unknown."""
+    tier = arg or default
+    if tier in frames.TIERS or (allow_auto and tier == "auto"):
+        return tier
+    return None
+
+# Frames and solved images get ETags from their frame seq or solve id, so
+# clients polling them get a 304 until there is something new.  ETAG_BOOT
+# keeps ids from before a restart from matching.
+ETAG_BOOT = format(time.time_ns(), 'x')
+
+def make_etag(kind, *parts):
+    return "-".join([kind, ETAG_BOOT] + [str(p) for p in parts])
+
+def not_modified(etag):
+    """A 304 response if the client already has `etag`, else None."""
+    if not request.if_none_match.contains_weak(etag):
+        return None
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+def jpeg_response(jpeg, etag):
+    response = Response(jpeg, mimetype='image/jpeg')
+    response.set_etag(etag)
+    # Clients may keep it, but must check with us before showing it again
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @app.route('/video_feed')
 def video_feed():
-    """Return the latest video frame."""
-    global latest_frame_bytes
-    if latest_frame_bytes:
-        return Response(latest_frame_bytes, mimetype='image/jpeg')
-    return "", 204 # No content if no frame is available yet
+    """Return the latest video frame, at ?tier=full|half|thumb."""
+    tier = parse_tier(request.args.get('tier'))
+    if tier is None:
+        return "Unknown tier", 400
+    seq, frame = frame_ring.latest_jpeg(tier)
+    if not frame:
+        return "", 204 # No content if no frame is available yet
+    etag = make_etag("frame", seq, tier)
+    return not_modified(etag) or jpeg_response(frame, etag)
+
+def mjpeg_part(frame):
+    return (b"--frame\r\n"
+            b"Content-Type: image/jpeg\r\n"
+            b"Content-Length: " + str(len(frame)).encode() + b"\r\n\r\n" +
+            frame + b"\r\n")
+
+def generate_mjpeg(tier):
+    """Yield each new frame once as a multipart/x-mixed-replace part.
+
+    A client that falls behind only ever sees the newest frame; anything
+    published while it was still sending is dropped, not queued.  With
+    tier "auto" the tier follows how long the client takes to receive
+    each frame (see frames.AdaptiveTier).
+    """
+    adaptive = frames.AdaptiveTier(STREAM_FRAME_BUDGET) if tier == "auto" else None
+    last_seq = None
+    while True:
+        if adaptive:
+            tier = adaptive.tier
+        # While paused no frames arrive; the timeout resends the current one
+        # now and then so the connection stays up and dead clients get noticed.
+        last_seq, frame = frame_ring.wait_for_jpeg(last_seq, timeout=5.0, tier=tier)
+        if frame is None:
+            continue
+        sending = time.monotonic()
+        # The server writes each part out before asking for the next one,
+        # so the time until we resume is how long the client took to take it
+        yield mjpeg_part(frame)
+        if adaptive:
+            adaptive.sent(time.monotonic() - sending)
+
+def limit_unsent(sock, nbytes=16384):
+    """Make writes to sock block while more than nbytes are waiting to go out.
+
+    Otherwise the kernel buffers megabytes for a slow client: frames queue
+    up behind each other, and sends look instant to AdaptiveTier.
+    """
+    try:
+        if hasattr(socket, "TCP_NOTSENT_LOWAT"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NOTSENT_LOWAT, nbytes)
+        else:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, nbytes * 4)
+    except OSError as e:
+        print(f"Warning: could not limit the stream's send buffer: {e}")
+
+@app.route('/stream')
+def stream():
+    """Push the live view as an MJPEG stream, at ?tier=auto|full|half|thumb."""
+    tier = parse_tier(request.args.get('tier'), default="auto", allow_auto=True)
+    if tier is None:
+        return "Unknown tier", 400
+    sock = request.environ.get("werkzeug.socket")
+    if sock is not None:
+        limit_unsent(sock)
+    return Response(generate_mjpeg(tier), mimetype='multipart/x-mixed-replace; boundary=frame')
 
 @app.route('/capture_lores_jpeg')
 def capture_lores_jpeg():
-    """Capture a lores (640x480) JPEG image."""
-    buffer = io.BytesIO()
-    camera.capture_file(buffer, name='lores', format='jpeg')
-    frame = buffer.getvalue()
+    """Return the newest lores (640x480) JPEG image from the frame ring."""
+    _, frame = frame_ring.latest_jpeg()
+    if frame is None:
+        return "", 503
     return Response(frame, mimetype='image/jpeg')
 
+# Full resolution snapshots are taken on demand.  Requests that arrive
+# while one is being taken wait for it and share it, rather than each
+# capturing and encoding their own.
+snapshot_lock = threading.Lock()
+last_snapshot = (0.0, None) # (time.monotonic() when taken, JPEG bytes)
+
 @app.route('/snapshot')
 def snapshot():
     """Capture a full resolution (1456x1088) JPEG image."""
-    buffer = io.BytesIO()
-    camera.capture_file(buffer, name='main', format='jpeg')
-    frame = buffer.getvalue()
+    global last_snapshot
+    asked = time.monotonic()
+    with snapshot_lock:
+        taken, frame = last_snapshot
+        if taken < asked:
+            frame = camera.capture_jpeg()
+            last_snapshot = (time.monotonic(), frame)
     return Response(frame, mimetype='image/jpeg')
 
 @app.route('/set_controls', methods=['POST'])
@@ -683,30 +1065,299 @@ def set_controls():
     safe_set_controls(controls_to_set)
     return "", 204
 
+def parse_overlays(arg):
+    """Turn ?overlays=labels,boundaries into a tuple for render_solved_field()."""
+    if arg is None:
+        return solver.OVERLAYS
+    names = arg.split(',')
+    return tuple(o for o in solver.OVERLAYS if o in names)
+
 @app.route('/solved_field.jpg')
 def serve_solved_image():
-    """Serve the most recent solved image from memory (avoids writing to disk)."""
+    """Serve the newest solved frame, drawn with the requested overlays.
+
+    Frames are only drawn when asked for, once per solve and overlay set,
+    and not at all for a client that already has them (If-None-Match).
+    """
+    overlays = parse_overlays(request.args.get('overlays'))
     with solved_image_lock:
-        if solved_image_bytes:
-            return Response(solved_image_bytes, mimetype='image/jpeg')
-        else:
+        if solved_frame is None:
             return "", 404
+        this_solve_id, image, solution = solved_frame
+        etag = make_etag("solve", this_solve_id, *overlays)
+        response = not_modified(etag)
+        if response:
+            return response
+        key = (this_solve_id, overlays)
+        image_bytes = solved_field_cache.get(key)
+        pool = solve_pool
+        if image_bytes is None:
+            future = solved_field_renders.get(key)
+            if future is None:
+                try:
+                    future = pool.submit(solver.render_solved_field, image, solution, overlays)
+                except BrokenProcessPool:
+                    restart_solve_pool(pool)
+                    return "", 503
+                solved_field_renders[key] = future
+    if image_bytes is None:
+        try:
+            with solve_stage_time.labels(stage="render").time():
+                image_bytes = future.result()
+            jpeg_size.labels(kind="solved").observe(len(image_bytes))
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                restart_solve_pool(pool)
+            print(f"Error rendering solved field: {e}")
+            with solved_image_lock:
+                solved_field_renders.pop(key, None)
+            return "", 500
+        with solved_image_lock:
+            solved_field_renders.pop(key, None)
+            solved_field_cache[key] = image_bytes
+            while len(solved_field_cache) > SOLVED_FIELD_CACHE_SIZE:
+                solved_field_cache.popitem(last=False)
+    return jpeg_response(image_bytes, etag)
+
+def stars_in_field():
+    """Mask of catalog stars inside the newest solved frame, or None."""
+    with solved_image_lock:
+        if solved_frame is None:
+            return None
+        _, image, solution = solved_frame
+    if not solver.is_solved(solution) or solution.get('wcs') is None:
+        return None
+    height, width = image.shape[:2]
+    # Cheap cone test first, then the exact frame through the WCS
+    radius = 0.5 * (solution.get('FOV') or 20.0) * math.hypot(width, height) / width
+    centre = boundaries.radec_to_xyz(solution['RA'], solution['Dec'])
+    with np.errstate(invalid='ignore'):
+        near = star_catalog.xyz @ centre >= math.cos(math.radians(radius))
+    mask = np.zeros(len(near), dtype=bool)
+    candidates = np.flatnonzero(near)
+    x, y = solution['wcs'].world_to_pixel(star_catalog.ra[candidates], star_catalog.dec[candidates])
+    mask[candidates] = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+    return mask
+
+@app.route('/api/visible')
+def visible():
+    """What's up: named stars above the horizon, or in the current field.
+
+    ?scope=up (default) or field, ?min_alt= degrees (default 0),
+    ?sort=alt (highest first, default) or mag (brightest first),
+    ?offset= and ?limit= (default 50, at most 500) to page through them.
+    Hour angle and sidereal time are in hours, everything else in degrees.
+    """
+    scope = request.args.get('scope', 'up')
+    min_alt = request.args.get('min_alt', 0.0, type=float)
+    sort = request.args.get('sort', 'alt')
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+
+    now = sky_index.at()
+    in_field = stars_in_field()
+    if scope == 'field':
+        mask = in_field if in_field is not None else np.zeros(len(now.alt), dtype=bool)
+    else:
+        with np.errstate(invalid='ignore'):
+            mask = now.alt >= min_alt
+    selected = np.flatnonzero(mask)
+    if sort == 'mag':
+        selected = selected[np.argsort(star_catalog.mag[selected], kind='stable')]
+    else:
+        selected = selected[np.argsort(-now.alt[selected], kind='stable')]
+
+    objects = []
+    for i in selected[offset:offset + limit].tolist():
+        objects.append({
+            "id": int(star_catalog.names.catids[i]),
+            "name": star_catalog.names.name_at(i),
+            "label": star_catalog.labels.name_at(i),
+            "ra": round(float(star_catalog.ra[i]), 4),
+            "dec": round(float(star_catalog.dec[i]), 4),
+            "mag": round(float(star_catalog.mag[i]), 2),
+            "alt": round(float(now.alt[i]), 2),
+            "az": round(float(now.az[i]), 2),
+            "ha": round(float(now.ha[i]) / 15, 3),
+            "in_field": bool(in_field is not None and in_field[i]),
+        })
+    return jsonify(time=now.time, lst=round(now.lst / 15, 4), total=len(selected),
+                   offset=offset, limit=limit, objects=objects)
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+def record_response(endpoint, code, started=None):
+    if started is not None:
+        http_request_time.labels(endpoint=endpoint).observe(time.perf_counter() - started)
+    http_responses.labels(endpoint=endpoint, code=code).inc()
+
+@app.after_request
+def record_request(response):
+    """Time every request; streamed responses only until they start."""
+    record_response(request.endpoint or "none", response.status_code,
+                    getattr(g, "request_started", None))
+    return response
+
+@app.route('/metrics')
+def metrics_endpoint():
+    """Counters and latency histograms, in Prometheus text format."""
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/stellarium')
+def stellarium_status():
+    """Counts of poses sent to Stellarium, failed, and replaced by newer ones."""
+    if stellarium_publisher is None:
+        return jsonify(enabled=False)
+    return jsonify(enabled=True, **stellarium_publisher.stats())
+
+@app.route('/ready')
+def ready():
+    """Report which subsystems are loaded, why any failed, and what startup cost."""
+    return jsonify(ready=all(subsystems_ready.values()),
+                   subsystems=subsystems_ready,
+                   errors=startup_errors,
+                   startup_times_ms=startup_times)
 
 @app.route('/api/i2c')
 def i2c_status():
-    """Return the status of I2C peripherals."""
-    status = {}
-    for peripheral in i2c.get_detected_peripherals():
-        status[peripheral] = {}
-        for value_name in i2c.get_peripheral_value_names(peripheral):
-            status[peripheral][value_name] = i2c.get_peripheral_value(peripheral, value_name)
-    return jsonify(status)
+    """Return the latest reading of each I2C peripheral.
+
+    Each has its values, when they were read (time and age in seconds),
+    whether that is stale, and its read errors; ?history=1 adds the
+    buffered readings.  Nothing here touches the bus, unless [i2c]
+    sample_rate is 0: then each peripheral is read now, with read_all().
+    """
+    with_history = request.args.get('history', '0') not in ('0', 'false', '')
+    if I2C_SAMPLE_RATE <= 0:
+        return jsonify(i2c.read_all_peripherals(with_history))
+    return jsonify(i2c.get_sampled_status(with_history))
+
+# The same streams for the asyncio server ([server] mode = async, see
+# asyncserver.py).  Each Broadcaster thread waits for new frames, status or
+# solves once, for every client.
+frame_broadcaster = asyncserver.Broadcaster(
+    lambda seq: frame_ring.wait_for_jpeg(seq, timeout=5.0)[0], "frame fan-out")
+status_broadcaster = asyncserver.Broadcaster(wait_for_status_change, "status fan-out")
+solve_broadcaster = asyncserver.Broadcaster(
+    lambda last_id: solve_history.wait(last_id or 0), "solve fan-out")
+
+def int_arg(args, name, default=0):
+    try:
+        return int(args.get(name, default))
+    except ValueError:
+        return default
+
+async def stream_async(req):
+    """/stream for the asyncio server; see generate_mjpeg()."""
+    started = time.perf_counter()
+    tier = parse_tier(req.args.get('tier'), default="auto", allow_auto=True)
+    if tier is None:
+        record_response("stream", 400, started)
+        await req.respond(400, b"Unknown tier")
+        return
+    limit_unsent(req.socket)
+    await req.start(200, [("Content-Type", "multipart/x-mixed-replace; boundary=frame"),
+                          ("Cache-Control", "no-cache")])
+    record_response("stream", 200, started)
+    adaptive = frames.AdaptiveTier(STREAM_FRAME_BUDGET) if tier == "auto" else None
+    # Frames arrive every 5 s even while paused (see generate_mjpeg())
+    updates = frame_broadcaster.subscribe()
+    try:
+        while True:
+            await updates.get()
+            if adaptive:
+                tier = adaptive.tier
+            _, frame = frame_ring.latest_jpeg(tier)
+            if frame is None:
+                continue
+            sending = time.monotonic()
+            await req.write(mjpeg_part(frame))
+            if adaptive:
+                adaptive.sent(time.monotonic() - sending)
+    finally:
+        frame_broadcaster.unsubscribe(updates)
+
+async def events_async(req):
+    """/events for the asyncio server; see generate_status_events()."""
+    started = time.perf_counter()
+    await req.start(200, [("Content-Type", "text/event-stream"), ("Cache-Control", "no-cache")])
+    record_response("events", 200, started)
+    updates = status_broadcaster.subscribe()
+    last_status = None
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(updates.get(), 15.0)
+                changed = True
+            except asyncio.TimeoutError:
+                changed = False
+            status = get_status_snapshot()
+            if status != last_status:
+                last_status = status
+                await req.write(f"data: {json.dumps(status)}\n\n".encode())
+            elif not changed:
+                await req.write(b": keep-alive\n\n")
+    finally:
+        status_broadcaster.unsubscribe(updates)
+
+async def solves_async(req):
+    """/api/solves for the asyncio server; see generate_solve_records()."""
+    started = time.perf_counter()
+    after_id = int_arg(req.args, 'since')
+    follow = req.args.get('follow', '0') not in ('0', 'false', '')
+    await req.start(200, [("Content-Type", "application/x-ndjson"), ("Cache-Control", "no-cache")])
+    record_response("solves", 200, started)
+    updates = solve_broadcaster.subscribe() if follow else None
+    try:
+        while True:
+            records = solve_history.since(after_id)
+            if len(records):
+                after_id = int(records["id"][-1])
+                await req.write(history.to_json_lines(records).encode())
+            if not follow:
+                return
+            try:
+                await asyncio.wait_for(updates.get(), 15.0)
+            except asyncio.TimeoutError:
+                await req.write(b"\n")
+    finally:
+        if updates is not None:
+            solve_broadcaster.unsubscribe(updates)
+
+ASYNC_STREAMS = {
+    "/stream": stream_async,
+    "/events": events_async,
+    "/api/solves": solves_async,
+}
 
 if __name__ == '__main__':
-    load_constellation_boundaries()
-    i2c.init_peripherals()
-    solve_fps_thread = threading.Thread(target=calculate_solve_fps)
-    solve_fps_thread.daemon = True
-    solve_fps_thread.start()
-    logging.getLogger("werkzeug").setLevel(logging.WARNING)
-    app.run(host='0.0.0.0', port=8080, threaded=True)
+    i2c_thread = threading.Thread(target=init_i2c)
+    i2c_thread.daemon = True
+    i2c_thread.start()
+    warm_up_thread = threading.Thread(target=warm_up_solver)
+    warm_up_thread.daemon = True
+    warm_up_thread.start()
+    solver_thread = threading.Thread(target=solver_worker)
+    solver_thread.daemon = True
+    solver_thread.start()
+    solve_publisher_thread = threading.Thread(target=solve_publisher)
+    solve_publisher_thread.daemon = True
+    solve_publisher_thread.start()
+    if stellarium_publisher is not None:
+        stellarium_publisher.start()
+    auto_solve_thread = threading.Thread(target=auto_solver)
+    auto_solve_thread.daemon = True
+    auto_solve_thread.start()
+    system_stats_thread = threading.Thread(target=monitor_system_stats)
+    system_stats_thread.daemon = True
+    system_stats_thread.start()
+    # [server] mode = async serves everything from one event loop, with
+    # blocking routes in a pool of `workers` threads (see asyncserver.py)
+    if config.get('server', 'mode', fallback='threaded') == 'async':
+        asyncserver.AsyncServer(app, ASYNC_STREAMS,
+                                workers=config.getint('server', 'workers', fallback=4)).run('0.0.0.0', 8080)
+    else:
+        logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        app.run(host='0.0.0.0', port=8080, threaded=True)
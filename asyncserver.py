@@ -0,0 +1,243 @@
+# Asyncio serving mode
+#
+# Flask's threaded server runs one OS thread per connection, so a few dozen
+# live views and /events clients become dozens of threads fighting over
+# the GIL.  With [server] mode = async, app.py is served from one asyncio
+# event loop instead:
+#
+#  - long-lived streams (the live view, /events, followed solve history) are
+#    coroutines, registered by path.  They are fed by Broadcasters: one
+#    thread waits for the next frame or status change and pushes it to
+#    every client's asyncio.Queue.
+#  - every other route is the Flask app itself, run to completion in a
+#    small, bounded pool of threads, so camera and solver calls can block
+#    there without holding up the loop.
+#
+# It speaks just enough HTTP/1.1 for this app (keep-alive, Content-Length
+# request bodies, no TLS), and is meant for the Pi on a local network.
+
+import asyncio
+import io
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+
+MAX_HEADER_BYTES = 65536
+MAX_BODY_BYTES = 16 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 30.0
+
+
+class Broadcaster:
+    """Fans a blocking "wait for the next thing" out to async subscribers.
+
+    A thread calls wait_next(last value) over and over, and each value it
+    returns is put in every subscriber's queue.  The queues only hold the
+    newest value, so a slow subscriber skips values instead of falling
+    behind.
+    """
+    def __init__(self, wait_next, name="broadcaster"):
+        self.wait_next = wait_next
+        self.name = name
+        self._subscribers = set()
+        self._loop = None
+        self._thread = None
+
+    def subscribe(self):
+        """Return a new queue of values; call from the event loop."""
+        self._loop = asyncio.get_running_loop()
+        queue = asyncio.Queue(maxsize=1)
+        self._subscribers.add(queue)
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return queue
+
+    def unsubscribe(self, queue):
+        self._subscribers.discard(queue)
+
+    def _run(self):
+        value = None
+        while True:
+            try:
+                value = self.wait_next(value)
+            except Exception as e:
+                print(f"Error in {self.name}: {e}")
+                time.sleep(1)
+                continue
+            self._loop.call_soon_threadsafe(self._publish, value)
+
+    def _publish(self, value):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(value)
+
+
+class StreamRequest:
+    """A request to a stream route.
+
+    The handler calls start() (or respond() for a one-off answer) and then
+    write() as often as it likes; the connection is closed when it returns.
+    """
+    def __init__(self, method, target, headers, writer):
+        self.method = method
+        path, _, self.query_string = target.partition('?')
+        self.path = urllib.parse.unquote(path)
+        self.args = {name: values[-1] for name, values
+                     in urllib.parse.parse_qs(self.query_string).items()}
+        self.headers = headers  # names in lower case
+        self.writer = writer
+        self.socket = writer.get_extra_info('socket')
+
+    async def start(self, status, headers):
+        """Send the status line and headers; the body runs until we close."""
+        lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"]
+        lines += [f"{name}: {value}" for name, value in headers]
+        lines += ["Connection: close", "", ""]
+        # Let drain() wait for the client instead of buffering frames for it
+        self.writer.transport.set_write_buffer_limits(high=16384)
+        await self.write("\r\n".join(lines).encode('latin-1'))
+
+    async def respond(self, status, body=b"", content_type="text/plain"):
+        await self.start(status, [("Content-Type", content_type),
+                                  ("Content-Length", str(len(body)))])
+        await self.write(body)
+
+    async def write(self, data):
+        """Send data, waiting while the client is behind."""
+        if self.writer.is_closing():
+            raise ConnectionResetError("client went away")
+        self.writer.write(data)
+        await self.writer.drain()
+
+
+class AsyncServer:
+    """Serves a WSGI app plus async stream handlers from one event loop.
+
+    `streams` maps paths to `async def handler(StreamRequest)`.  Everything
+    else goes to `wsgi_app` in a pool of `workers` threads, which must not
+    return endless responses (register those as streams).
+    """
+    def __init__(self, wsgi_app, streams=None, workers=4):
+        self.wsgi_app = wsgi_app
+        self.streams = streams or {}
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="wsgi")
+
+    def run(self, host="0.0.0.0", port=8080):
+        asyncio.run(self._serve(host, port))
+
+    async def _serve(self, host, port):
+        server = await asyncio.start_server(self._connection, host, port, limit=MAX_HEADER_BYTES)
+        print(f"Serving on http://{host}:{port} (asyncio, {self.workers} workers)")
+        async with server:
+            await server.serve_forever()
+
+    async def _connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), KEEP_ALIVE_TIMEOUT)
+                except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError):
+                    return
+                lines = head.decode('latin-1').split("\r\n")
+                try:
+                    method, target, version = lines[0].split(" ")
+                except ValueError:
+                    await self._send(writer, "400 Bad Request", [], b"", False)
+                    return
+                headers = {}
+                for line in lines[1:]:
+                    name, sep, value = line.partition(":")
+                    if sep:
+                        headers[name.strip().lower()] = value.strip()
+
+                handler = self.streams.get(urllib.parse.unquote(target.partition('?')[0]))
+                if handler is not None:
+                    await handler(StreamRequest(method, target, headers, writer))
+                    return
+
+                if "transfer-encoding" in headers:
+                    await self._send(writer, "411 Length Required", [], b"", False)
+                    return
+                try:
+                    length = int(headers.get("content-length") or 0)
+                except ValueError:
+                    length = -1
+                if not 0 <= length <= MAX_BODY_BYTES:
+                    await self._send(writer, "413 Content Too Large", [], b"", False)
+                    return
+                body = await reader.readexactly(length) if length else b""
+
+                connection = headers.get("connection", "").lower()
+                keep_alive = (connection != "close" if version == "HTTP/1.1"
+                              else connection == "keep-alive")
+                environ = self._environ(method, target, version, headers, body, writer)
+                loop = asyncio.get_running_loop()
+                status, response_headers, response_body = await loop.run_in_executor(
+                    self.executor, self._call_wsgi, environ)
+                await self._send(writer, status, response_headers, response_body, keep_alive,
+                                 send_body=method != "HEAD")
+                if not keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f"Error serving request: {e}")
+        finally:
+            writer.close()
+
+    def _environ(self, method, target, version, headers, body, writer):
+        path, _, query = target.partition('?')
+        host, port = (writer.get_extra_info('sockname') or ("", 0))[:2]
+        peer = writer.get_extra_info('peername') or ("", 0)
+        environ = {
+            "REQUEST_METHOD": method,
+            "SCRIPT_NAME": "",
+            "PATH_INFO": urllib.parse.unquote(path, 'latin-1'),
+            "QUERY_STRING": query,
+            "SERVER_NAME": str(host),
+            "SERVER_PORT": str(port),
+            "SERVER_PROTOCOL": version,
+            "REMOTE_ADDR": str(peer[0]),
+            "CONTENT_TYPE": headers.get("content-type", ""),
+            "CONTENT_LENGTH": str(len(body)) if body else "",
+            "wsgi.version": (1, 0),
+            "wsgi.url_scheme": "http",
+            "wsgi.input": io.BytesIO(body),
+            "wsgi.errors": sys.stderr,
+            "wsgi.multithread": True,
+            "wsgi.multiprocess": False,
+            "wsgi.run_once": False,
+        }
+        for name, value in headers.items():
+            if name not in ("content-type", "content-length"):
+                environ["HTTP_" + name.upper().replace("-", "_")] = value
+        return environ
+
+    def _call_wsgi(self, environ):
+        """Run the WSGI app to the end of its response (in a worker thread)."""
+        started = {}
+        def start_response(status, headers, exc_info=None):
+            started["status"] = status
+            started["headers"] = headers
+        result = self.wsgi_app(environ, start_response)
+        try:
+            body = b"".join(result)
+        finally:
+            if hasattr(result, "close"):
+                result.close()
+        return started["status"], started["headers"], body
+
+    async def _send(self, writer, status, headers, body, keep_alive, send_body=True):
+        lines = [f"HTTP/1.1 {status}"]
+        lines += [f"{name}: {value}" for name, value in headers
+                  if name.lower() not in ("connection", "content-length")]
+        if not status.startswith(("204", "304")):
+            lines.append(f"Content-Length: {len(body)}")
+        lines += [f"Connection: {'keep-alive' if keep_alive else 'close'}", "", ""]
+        writer.write("\r\n".join(lines).encode('latin-1') + (body if send_body else b""))
+        await writer.drain()
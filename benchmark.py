@@ -0,0 +1,190 @@
+# Offline solve pipeline benchmark
+#
+# Runs every stage of the solve pipeline on the images in test-images/,
+# without a camera or the web app, and times each one separately:
+#
+#   python benchmark.py                      # print a table
+#   python benchmark.py -o pi.json           # ...and save the results
+#   python benchmark.py --compare pi.json    # ...and diff against a saved run
+#
+# Everything runs in this one process, so the numbers are per stage, not
+# what the app sees end to end with its pool of solver workers.  Peak memory
+# is reported both as the process's max RSS and as the peak of Python and
+# NumPy allocations during one pass (tracemalloc).
+
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+import solver
+import tanwcs
+import tracking
+
+STAGES = [
+    "load",             # read and decode the JPEG to a luminance array
+    "centroid",         # tetra3.get_centroids_from_image
+    "match",            # tetra3 lost-in-space solve
+    "track",            # tracking.track from the frame's own solution
+    "wcs fit",          # tanwcs.fit_solution
+    "draw centroids",
+    "draw labels",
+    "project boundaries",
+    "draw boundaries",
+    "jpeg encode",
+]
+
+
+class Timer:
+    """Collects durations (ms) per stage."""
+    def __init__(self):
+        self.times = {stage: [] for stage in STAGES}
+
+    def run(self, stage, fn, *args, **kwargs):
+        t0 = time.perf_counter()
+        result = fn(*args, **kwargs)
+        self.times[stage].append((time.perf_counter() - t0) * 1000)
+        return result
+
+
+def load_image(path):
+    return np.asarray(Image.open(path).convert('L'))
+
+
+def run_pipeline(timer, path):
+    """Time one image through every stage; returns False if it didn't solve."""
+    luminance = timer.run("load", load_image, path)
+    centroids = timer.run("centroid", solver.tetra3.get_centroids_from_image, luminance)
+    size = luminance.shape[:2]
+    solution = timer.run("match", solver.tetra.solve_from_centroids, centroids, size,
+                         distortion=solver.DISTORTION, return_matches=True)
+    if not solver.is_solved(solution):
+        return False
+    solution['centroids'] = np.asarray(centroids, dtype=np.float32)
+    timer.run("track", tracking.track, centroids, size, solution,
+              solver.tetra.star_table, solver.tetra.star_catalog_IDs,
+              distortion=solver.DISTORTION)
+    wcs = timer.run("wcs fit", tanwcs.fit_solution, solution)
+
+    image = Image.fromarray(luminance).convert('RGB')
+    draw = ImageDraw.Draw(image)
+    timer.run("draw centroids", solver.draw_centroids, draw, solution)
+    timer.run("draw labels", solver.draw_labels, image, draw, solution)
+    segments = timer.run("project boundaries", solver.project_boundaries, solution, wcs, size)
+    timer.run("draw boundaries", solver.draw_boundaries, draw, segments)
+    timer.run("jpeg encode", solver.encode_jpeg, image)
+    return True
+
+
+def summarise(times):
+    stats = {}
+    for stage, samples in times.items():
+        if not samples:
+            continue
+        a = np.array(samples)
+        stats[stage] = {
+            "n": len(a),
+            "mean": round(float(a.mean()), 3),
+            "min": round(float(a.min()), 3),
+            "p50": round(float(np.percentile(a, 50)), 3),
+            "p90": round(float(np.percentile(a, 90)), 3),
+            "p99": round(float(np.percentile(a, 99)), 3),
+            "max": round(float(a.max()), 3),
+        }
+    return stats
+
+
+def print_stats(stats, baseline=None):
+    header = f"{'stage':20} {'n':>5} {'mean':>9} {'p50':>9} {'p90':>9} {'p99':>9} {'max':>9}"
+    if baseline:
+        header += f" {'p50 was':>9} {'change':>8}"
+    print(header + "   (ms)")
+    for stage, s in stats.items():
+        line = f"{stage:20} {s['n']:5} {s['mean']:9.2f} {s['p50']:9.2f} {s['p90']:9.2f} {s['p99']:9.2f} {s['max']:9.2f}"
+        old = (baseline or {}).get(stage)
+        if old:
+            change = (s['p50'] - old['p50']) / old['p50'] * 100 if old['p50'] else 0.0
+            line += f" {old['p50']:9.2f} {change:+7.1f}%"
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the solve pipeline on test images.")
+    parser.add_argument("--images", default="test-images", help="directory of JPEGs to solve")
+    parser.add_argument("-n", "--repeat", type=int, default=5, help="passes over the images")
+    parser.add_argument("-o", "--output", help="save results to this JSON file")
+    parser.add_argument("--compare", help="JSON file from an earlier run to compare against")
+    parser.add_argument("--font", default=solver.font_path, help="TrueType font for the labels")
+    args = parser.parse_args()
+    solver.font_path = args.font
+
+    paths = [os.path.join(args.images, f) for f in sorted(os.listdir(args.images))
+             if f.lower().endswith(('.jpg', '.jpeg'))]
+    if not paths:
+        sys.exit(f"No test images in {args.images}")
+
+    t0 = time.perf_counter()
+    solver.warm_up()
+    load_times = dict(solver.load_times)
+    load_times["total"] = round((time.perf_counter() - t0) * 1000, 1)
+
+    # One untimed pass so first-use costs (sprite cache, lazy imports) are
+    # not counted as stage time
+    for path in paths:
+        run_pipeline(Timer(), path)
+
+    timer = Timer()
+    unsolved = 0
+    for _ in range(args.repeat):
+        for path in paths:
+            if not run_pipeline(timer, path):
+                unsolved += 1
+
+    # tracemalloc slows everything down, so memory gets its own pass
+    tracemalloc.start()
+    for path in paths:
+        run_pipeline(Timer(), path)
+    _, peak_traced = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    stats = summarise(timer.times)
+    results = {
+        "host": platform.node(),
+        "machine": platform.machine(),
+        "platform": platform.platform(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "images": len(paths),
+        "repeat": args.repeat,
+        "unsolved": unsolved,
+        "load_times_ms": load_times,
+        # ru_maxrss is in KiB on Linux
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "peak_traced_mb": round(peak_traced / 1024 / 1024, 1),
+        "stages": stats,
+    }
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["stages"]
+    print(f"{len(paths)} images x {args.repeat}, {unsolved} unsolved; "
+          f"peak RSS {results['peak_rss_mb']} MB, peak traced {results['peak_traced_mb']} MB")
+    print_stats(stats, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+# Constellation boundaries
+#
+# bound_20.dat lists the outline of every constellation as a run of RA/Dec
+# vertices.  We keep them as flat NumPy arrays with per-constellation
+# offsets, and index the outline segments by declination so that drawing a
+# solved field only has to look at the segments near it.
+
+import math
+
+import numpy as np
+
+
+def radec_to_xyz(ra, dec):
+    """Convert RA/Dec in degrees to unit vectors (last axis is x, y, z)."""
+    ra = np.radians(ra)
+    dec = np.radians(dec)
+    cos_dec = np.cos(dec)
+    return np.stack([cos_dec * np.cos(ra), cos_dec * np.sin(ra), np.sin(dec)], axis=-1)
+
+
+class Boundaries:
+    """Constellation outlines with a declination index over their segments.
+
+    Vertices offsets[k]:offsets[k+1] make up the outline of names[k].  Each
+    vertex starts a segment to the next vertex of the same outline; the last
+    one closes the outline back to its first vertex.
+    """
+    def __init__(self, names, offsets, ra, dec):
+        self.names = list(names)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        # Arrays are used as given, so they can be float32 views into the
+        # memory-mapped catalog cache (see catalog.py)
+        self.ra = np.asarray(ra)
+        self.dec = np.asarray(dec)
+        self.xyz = radec_to_xyz(self.ra, self.dec)
+
+        self.seg_start = np.arange(len(self.ra))
+        self.seg_end = self.seg_start + 1
+        if len(self.names):
+            self.seg_end[self.offsets[1:] - 1] = self.offsets[:-1]
+
+        # Longest segment, so queries can pad their search radius by it
+        cos_len = np.einsum('ij,ij->i', self.xyz[self.seg_start], self.xyz[self.seg_end])
+        self.max_segment = math.degrees(np.arccos(np.clip(cos_len.min(), -1, 1))) if len(cos_len) else 0.0
+
+        # Index: segments sorted by the lower declination of their endpoints
+        seg_min_dec = np.minimum(self.dec[self.seg_start], self.dec[self.seg_end])
+        self.order = np.argsort(seg_min_dec, kind='stable')
+        self.sorted_min_dec = seg_min_dec[self.order]
+
+    def __len__(self):
+        return len(self.names)
+
+    def outline(self, name):
+        """Return the (ra, dec) vertex arrays of one constellation, or None."""
+        try:
+            k = self.names.index(name)
+        except ValueError:
+            return None
+        start, end = self.offsets[k], self.offsets[k + 1]
+        return self.ra[start:end], self.dec[start:end]
+
+    def segments_near(self, ra, dec, radius):
+        """Return (start, end) vertex indices of the segments that come
+        within `radius` degrees of (ra, dec).
+        """
+        # A segment's declination span is at most max_segment, so anything
+        # whose lower end is outside this range can't reach the circle.
+        pad = radius + self.max_segment
+        lo, hi = np.searchsorted(self.sorted_min_dec, [dec - pad, dec + radius], side='left')
+        candidates = self.order[lo:hi]
+
+        # Then, the segment can only be in the circle if one of its
+        # endpoints is within `pad` of the centre.
+        centre = radec_to_xyz(ra, dec)
+        cos_pad = math.cos(math.radians(min(pad, 180.0)))
+        start = self.seg_start[candidates]
+        end = self.seg_end[candidates]
+        near = (self.xyz[start] @ centre >= cos_pad) | (self.xyz[end] @ centre >= cos_pad)
+        return start[near], end[near]
+
+
+def parse(path="bound_20.dat"):
+    """Parse bound_20.dat into (names, offsets, ra, dec) lists, RA in degrees."""
+    names = []
+    offsets = []
+    ra = []
+    dec = []
+    with open(path, "r") as f:
+        for line in f:
+            constellation = line[23:27].strip()
+            if not names or names[-1] != constellation:
+                names.append(constellation)
+                offsets.append(len(ra))
+            # Convert RA from hours to degrees
+            ra.append(float(line[0:10]) * 15.0)
+            dec.append(float(line[11:22]))
+    offsets.append(len(ra))
+    return names, offsets, ra, dec
+
+
+def load(path="bound_20.dat"):
+    """Load bound_20.dat into a Boundaries object."""
+    return Boundaries(*parse(path))
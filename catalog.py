@@ -0,0 +1,317 @@
+# Compiled catalog cache
+#
+# Parsing ids.csv and bound_20.dat on every start is slow on the Pi, so we
+# compile them once into catalog.bin, a single file that is memory-mapped
+# at startup.  Star labels are decoded for display at the same time, so
+# the solver never has to, and each named star gets its RA/Dec and
+# magnitude from tetra3's star table (ids.csv has HIP numbers, as does the
+# default tetra3 database).  The layout is:
+#
+#   magic | header length (uint32) | JSON header | arrays, 64-byte aligned
+#
+# The header records the size and mtime of each source file; when any of
+# them changes, the cache is rebuilt.  Run `python catalog.py` to build it ahead
+# of time.
+
+import csv
+import importlib.util
+import json
+import os
+import struct
+import sys
+
+import numpy as np
+
+import boundaries
+
+CACHE_PATH = "catalog.bin"
+IDS_PATH = "ids.csv"
+BOUNDARIES_PATH = "bound_20.dat"
+
+MAGIC = b"FNDRCAT3"
+ALIGN = 64
+
+
+class CatalogNames:
+    """Read-only catalog id -> string mapping.
+
+    Backed by a sorted id array and a UTF-8 string table, so it can live in
+    the memory-mapped cache instead of a dict of Python strings.
+    """
+    def __init__(self, catids, offsets, strings):
+        self.catids = catids
+        self.offsets = offsets
+        self.strings = strings
+
+    def __len__(self):
+        return len(self.catids)
+
+    def _index(self, catid):
+        try:
+            catid = int(catid)
+        except (TypeError, ValueError):
+            return None
+        i = int(np.searchsorted(self.catids, catid))
+        if i < len(self.catids) and self.catids[i] == catid:
+            return i
+        return None
+
+    def __contains__(self, catid):
+        return self._index(catid) is not None
+
+    def name_at(self, i):
+        return bytes(self.strings[self.offsets[i]:self.offsets[i + 1]]).decode('utf-8')
+
+    def get(self, catid, default=None):
+        i = self._index(catid)
+        return default if i is None else self.name_at(i)
+
+    def __getitem__(self, catid):
+        i = self._index(catid)
+        if i is None:
+            raise KeyError(catid)
+        return self.name_at(i)
+
+
+class Catalog:
+    """The contents of the cache.
+
+    `names` maps catalog ids to names as they appear in ids.csv, `labels`
+    to the same names decoded for display (see display_label()).  `ra`,
+    `dec` (J2000 degrees), `mag` and the unit vectors `xyz` line up with
+    `names.catids`, and are NaN for stars tetra3's database doesn't have.
+    """
+    def __init__(self, header, arrays):
+        self.names = CatalogNames(arrays["ids_catid"], arrays["ids_offsets"], arrays["ids_strings"])
+        self.labels = CatalogNames(arrays["ids_catid"], arrays["labels_offsets"], arrays["labels_strings"])
+        self.ra = arrays["ids_ra"]
+        self.dec = arrays["ids_dec"]
+        self.mag = arrays["ids_mag"]
+        self.xyz = boundaries.radec_to_xyz(self.ra, self.dec)
+        self.boundaries = boundaries.Boundaries(header["boundary_names"], arrays["bound_offsets"],
+                                                arrays["bound_ra"], arrays["bound_dec"])
+
+
+# not the most efficient, but it only runs when the cache is built
+
+def decode_simbad_greek(text):
+    greek_map = { 'alf': 'α',  # alpha
+                  'bet': 'β',  # beta
+                  'gam': 'γ',  # gamma
+                  'del': 'δ',  # delta
+                  'eps': 'ε',  # epsilon
+                  'zet': 'ζ',  # zeta
+                  'eta': 'η',  # eta
+                  'tet': 'θ',  # theta
+                  'iot': 'ι',  # iota
+                  'kap': 'κ',  # kappa
+                  'lam': 'λ',  # lambda
+                  'mu.': 'μ',  # mu
+                  'nu.': 'ν',  # nu
+                  'ksi': 'ξ',  # xi
+                  'omi': 'ο',  # omicron
+                  'pi.': 'π',  # pi
+                  'rho': 'ρ',  # rho
+                  'sig': 'σ',  # sigma
+                  'tau': 'τ',  # tau
+                  'ups': 'υ',  # upsilon
+                  'phi': 'φ',  # phi
+                  'chi': 'χ',  # chi
+                  'psi': 'ψ',  # psi
+                  'ome': 'ω',  # omega
+          }
+    result = text
+    for code, greek in greek_map.items():
+        result = result.replace(code, greek)
+    return result
+
+
+def display_label(name):
+    """Turn an ids.csv name into the label drawn next to the star."""
+    label = decode_simbad_greek(name)
+    fields = label.split()
+    if fields and fields[0] == "*":
+        label = ' '.join(fields[1:])
+    return label
+
+
+def _stars_path():
+    """Where tetra3 keeps its default database, found without importing it."""
+    try:
+        spec = importlib.util.find_spec("tetra3")
+    except (ImportError, ValueError):
+        spec = None
+    if spec is None or not spec.submodule_search_locations:
+        return None
+    return os.path.join(list(spec.submodule_search_locations)[0], "data", "default_database.npz")
+
+
+def _source_stamps():
+    stamps = []
+    for path in (IDS_PATH, BOUNDARIES_PATH, _stars_path()):
+        try:
+            st = os.stat(path)
+            stamps.append([path, st.st_size, st.st_mtime_ns])
+        except (FileNotFoundError, TypeError):
+            stamps.append([path, None, None])
+    return stamps
+
+
+def _read_ids():
+    ids = {}
+    try:
+        with open(IDS_PATH, "r") as f:
+            rdr = csv.reader(f)
+            for a, b, c in rdr:
+                if b == '':
+                    ids[int(a)] = c
+                else:
+                    ids[int(a)] = b
+    except FileNotFoundError:
+        print(f"Warning: {IDS_PATH} not found. Stars will be labelled by catalog number.")
+    return ids
+
+
+def _read_boundaries():
+    try:
+        return boundaries.parse(BOUNDARIES_PATH)
+    except FileNotFoundError:
+        print(f"Warning: {BOUNDARIES_PATH} not found. Constellation boundaries will not be drawn.")
+        return [], [0], [], []
+
+
+def _read_positions(catids):
+    """Look up (ra, dec, mag) of each catalog id in tetra3's star table."""
+    ra = np.full(len(catids), np.nan)
+    dec = np.full(len(catids), np.nan)
+    mag = np.full(len(catids), np.nan)
+    path = _stars_path()
+    try:
+        with np.load(path) as database:
+            star_table = database["star_table"]
+            star_ids = database["star_catalog_IDs"]
+    except (OSError, TypeError, KeyError):
+        print(f"Warning: no tetra3 star table at {path}. Stars will have no positions.")
+        return ra, dec, mag
+    if star_ids.ndim != 1:
+        print("Warning: tetra3 database doesn't use HIP numbers. Stars will have no positions.")
+        return ra, dec, mag
+    order = np.argsort(star_ids)
+    i = np.minimum(np.searchsorted(star_ids, catids, sorter=order), len(order) - 1)
+    rows = order[i]
+    found = star_ids[rows] == catids
+    ra[found] = np.degrees(star_table[rows[found], 0])
+    dec[found] = np.degrees(star_table[rows[found], 1])
+    mag[found] = star_table[rows[found], 5]
+    return ra, dec, mag
+
+
+def _string_table(strings):
+    """Pack strings into (offsets, UTF-8 bytes) arrays."""
+    encoded = [string.encode('utf-8') for string in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(e) for e in encoded])
+    return offsets, np.frombuffer(b"".join(encoded), dtype=np.uint8)
+
+
+def compile_sources():
+    """Parse the source files into (header, arrays)."""
+    ids = _read_ids()
+    catids = np.array(sorted(ids), dtype=np.int64)
+    names = [ids[catid] for catid in catids.tolist()]
+    ids_offsets, ids_strings = _string_table(names)
+    labels_offsets, labels_strings = _string_table([display_label(name) for name in names])
+    ra, dec, mag = _read_positions(catids)
+
+    bound_names, bound_offsets, bound_ra, bound_dec = _read_boundaries()
+
+    arrays = {
+        "ids_catid": catids,
+        "ids_offsets": ids_offsets,
+        "ids_strings": ids_strings,
+        "labels_offsets": labels_offsets,
+        "labels_strings": labels_strings,
+        "ids_ra": ra,
+        "ids_dec": dec,
+        "ids_mag": mag.astype(np.float32),
+        "bound_offsets": np.array(bound_offsets, dtype=np.int64),
+        "bound_ra": np.array(bound_ra, dtype=np.float32),
+        "bound_dec": np.array(bound_dec, dtype=np.float32),
+    }
+    header = {"sources": _source_stamps(), "boundary_names": bound_names}
+    return header, arrays
+
+
+def _align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def write(header, arrays, path=CACHE_PATH):
+    """Write a cache file atomically."""
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        layout[name] = [array.dtype.str, list(array.shape), offset]
+        offset = _align(offset + array.nbytes)
+    header = dict(header, arrays=layout)
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _align(len(MAGIC) + 4 + len(header_bytes))
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(MAGIC)
+        f.write(struct.pack("<I", len(header_bytes)))
+        f.write(header_bytes)
+        for name, array in arrays.items():
+            f.seek(data_start + layout[name][2])
+            f.write(np.ascontiguousarray(array).tobytes())
+    os.replace(tmp_path, path)
+
+
+def read(path=CACHE_PATH):
+    """Memory-map a cache file and return (header, arrays)."""
+    mm = np.memmap(path, dtype=np.uint8, mode='r')
+    if bytes(mm[:len(MAGIC)]) != MAGIC:
+        raise ValueError(f"{path} is not a catalog cache")
+    (header_len,) = struct.unpack("<I", bytes(mm[len(MAGIC):len(MAGIC) + 4]))
+    header_end = len(MAGIC) + 4 + header_len
+    header = json.loads(bytes(mm[len(MAGIC) + 4:header_end]).decode('utf-8'))
+    data_start = _align(header_end)
+    arrays = {}
+    for name, (dtype, shape, offset) in header["arrays"].items():
+        dtype = np.dtype(dtype)
+        count = int(np.prod(shape))
+        start = data_start + offset
+        arrays[name] = mm[start:start + count * dtype.itemsize].view(dtype).reshape(shape)
+    return header, arrays
+
+
+def build(path=CACHE_PATH):
+    """Compile the sources and write the cache."""
+    header, arrays = compile_sources()
+    write(header, arrays, path)
+
+
+def load(path=CACHE_PATH):
+    """Return the Catalog, rebuilding the cache first if it is missing or stale."""
+    try:
+        header, arrays = read(path)
+        if header["sources"] == _source_stamps():
+            return Catalog(header, arrays)
+    except (OSError, ValueError, KeyError):
+        pass
+
+    header, arrays = compile_sources()
+    try:
+        write(header, arrays, path)
+        header, arrays = read(path)
+    except OSError as e:
+        # Read-only install or similar; just use what we parsed
+        print(f"Warning: could not write {path}: {e}")
+    return Catalog(header, arrays)
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else CACHE_PATH
+    build(path)
+    print(f"Wrote {path}")
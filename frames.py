@@ -0,0 +1,281 @@
+# Shared frame ring buffer
+#
+# The capture thread is the only thing that talks to the camera.  It copies
+# every lores frame into one of a fixed number of preallocated slots, and
+# everything else (live stream, solver, snapshots) reads from the ring.
+#
+# Each frame is JPEG-encoded once, in the capture thread, at a few sizes
+# ("tiers", see TIERS), and every client shares those bytes.  The full tier
+# is always encoded; smaller ones only while some client is asking for them.
+
+import contextlib
+import io
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+try:
+    import simplejpeg
+except ImportError:
+    simplejpeg = None
+
+
+class FrameSlot:
+    """One preallocated frame in the ring.
+
+    `array` is the raw YUV420 buffer, `seq` the frame sequence number,
+    `timestamp` the sensor timestamp (ns), and `exposure_time`/`analogue_gain`
+    what the sensor actually used for this frame.  `metadata` is the full
+    metadata dict from the camera, `jpegs` the encoded frame for the live
+    view, by tier.
+    """
+    def __init__(self):
+        self.array = None
+        self.seq = 0
+        self.timestamp = None
+        self.exposure_time = None
+        self.analogue_gain = None
+        self.metadata = {}
+        self.jpegs = {}
+        self.pins = 0
+
+    def luminance(self, size):
+        """Return the Y plane as a 2D view (no copy)."""
+        width, height = size
+        return self.array[:height, :width]
+
+
+class FrameRing:
+    """Fixed-size ring of frame slots with one writer and many readers.
+
+    Readers pin a slot while they use it (see latest()), and the writer skips
+    pinned slots, so a slow solve never sees its frame overwritten.
+    """
+    def __init__(self, slots=4):
+        self._slots = [FrameSlot() for _ in range(slots)]
+        self._next = 0
+        self._latest = None
+        self._condition = threading.Condition()
+        self.seq = 0
+        # tier -> time.monotonic() it was last asked for
+        self._tier_requests = {}
+
+    def write(self, array, metadata=None, jpegs=None):
+        """Copy a frame into the next free slot and wake up the readers."""
+        metadata = metadata or {}
+        with self._condition:
+            slot = self._free_slot()
+            if slot.array is None or slot.array.shape != array.shape:
+                slot.array = np.empty(array.shape, dtype=array.dtype)
+            np.copyto(slot.array, array)
+            self.seq += 1
+            slot.seq = self.seq
+            slot.timestamp = metadata.get("SensorTimestamp")
+            slot.exposure_time = metadata.get("ExposureTime")
+            slot.analogue_gain = metadata.get("AnalogueGain")
+            slot.metadata = metadata
+            slot.jpegs = jpegs or {}
+            self._latest = slot
+            self._condition.notify_all()
+            return slot.seq
+
+    def _free_slot(self):
+        for _ in range(len(self._slots)):
+            slot = self._slots[self._next]
+            self._next = (self._next + 1) % len(self._slots)
+            if slot.pins == 0 and slot is not self._latest:
+                return slot
+        raise RuntimeError("all frame slots are pinned")
+
+    @contextlib.contextmanager
+    def latest(self):
+        """Pin the newest frame for the duration of a with block.
+
+        Yields None if nothing has been captured yet.
+        """
+        with self._condition:
+            slot = self._latest
+            if slot is not None:
+                slot.pins += 1
+        try:
+            yield slot
+        finally:
+            if slot is not None:
+                with self._condition:
+                    slot.pins -= 1
+
+    def wanted_tiers(self, within=5.0):
+        """Tiers that someone asked for in the last `within` seconds, and full."""
+        now = time.monotonic()
+        with self._condition:
+            requests = list(self._tier_requests.items())
+        return ["full"] + [tier for tier, t in requests
+                           if tier != "full" and now - t < within]
+
+    def latest_jpeg(self, tier="full"):
+        """Return (seq, jpeg bytes) of the newest frame, or (0, None).
+
+        Until the capture thread has started encoding a tier, this gives the
+        next smaller one that it has (or the full one).
+        """
+        names = list(TIERS)
+        fallbacks = names[names.index(tier):] + names[:names.index(tier)][::-1]
+        with self._condition:
+            self._tier_requests[tier] = time.monotonic()
+            if self._latest is None:
+                return 0, None
+            jpegs = self._latest.jpegs
+            return self._latest.seq, next(jpegs[t] for t in fallbacks if t in jpegs)
+
+    def wait_for_frame(self, after_seq, timeout=None):
+        """Wait for a frame newer than after_seq; returns the newest seq.
+
+        On timeout, that may still be after_seq (or 0 if nothing was captured).
+        """
+        with self._condition:
+            self._condition.wait_for(lambda: self.seq != after_seq and self._latest is not None,
+                                     timeout=timeout)
+            return self.seq
+
+    def wait_for_jpeg(self, after_seq, timeout=None, tier="full"):
+        """Wait for a frame newer than after_seq and return (seq, jpeg).
+
+        Intermediate frames are skipped.  On timeout, returns the newest frame
+        we have (possibly the one already seen).
+        """
+        self.wait_for_frame(after_seq, timeout)
+        return self.latest_jpeg(tier)
+
+
+def sensor_clock_ns():
+    """Now, on the clock libcamera uses for SensorTimestamp (CLOCK_BOOTTIME)."""
+    return time.clock_gettime_ns(getattr(time, "CLOCK_BOOTTIME", time.CLOCK_MONOTONIC))
+
+def frame_age(timestamp):
+    """Seconds since the sensor captured a frame, from its SensorTimestamp.
+
+    Returns None when the frame has no timestamp.
+    """
+    if timestamp is None:
+        return None
+    return (sensor_clock_ns() - timestamp) / 1e9
+
+def yuv420_planes(array, size):
+    """Split a YUV420 buffer into (Y, U, V) views."""
+    width, height = size
+    stride = array.shape[1]
+    y = array[:height, :width]
+    uv = array[height:height + height // 2].reshape(height, stride // 2)
+    u = uv[:height // 2, :width // 2]
+    v = uv[height // 2:, :width // 2]
+    return y, u, v
+
+
+def yuv420_from_image(image, size):
+    """Convert a PIL image to a YUV420 buffer laid out like a lores frame."""
+    width, height = size
+    image = image.convert('RGB')
+    if image.size != size:
+        image = image.resize(size)
+    y, u, v = image.convert('YCbCr').split()
+    array = np.empty((height * 3 // 2, width), dtype=np.uint8)
+    array[:height] = np.asarray(y)
+    chroma = array[height:].reshape(2, height // 2, width // 2)
+    chroma[0] = np.asarray(u.resize((width // 2, height // 2)))
+    chroma[1] = np.asarray(v.resize((width // 2, height // 2)))
+    return array
+
+
+def image_from_yuv420(array, size):
+    """Convert a YUV420 buffer back to an RGB PIL image."""
+    y, u, v = yuv420_planes(array, size)
+    u = Image.fromarray(np.ascontiguousarray(u)).resize(size)
+    v = Image.fromarray(np.ascontiguousarray(v)).resize(size)
+    return Image.merge('YCbCr', (Image.fromarray(np.ascontiguousarray(y)), u, v)).convert('RGB')
+
+
+def encode_planes(planes, quality=85):
+    """JPEG-encode (Y, U, V) planes.
+
+    Uses simplejpeg (which Picamera2 already depends on) to encode straight
+    from the planes; without it, falls back to a grayscale image from Y.
+    """
+    y, u, v = planes
+    if simplejpeg is not None:
+        return simplejpeg.encode_jpeg_yuv_planes(y, u, v, quality=quality)
+    buf = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(y)).save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+# Live view tiers: name -> (times smaller than the lores frame, JPEG quality),
+# from the biggest down
+TIERS = {
+    "full": (1, 85),
+    "half": (2, 75),
+    "thumb": (4, 65),
+}
+
+
+def halve_plane(plane):
+    """Downscale a plane by 2 in each direction, averaging 2x2 blocks."""
+    h, w = plane.shape[0] // 2 * 2, plane.shape[1] // 2 * 2
+    p = plane[:h, :w].astype(np.uint16)
+    return ((p[0::2, 0::2] + p[1::2, 0::2] + p[0::2, 1::2] + p[1::2, 1::2] + 2) >> 2).astype(np.uint8)
+
+
+def encode_tiers(array, size, tiers=("full",)):
+    """JPEG-encode a YUV420 buffer once for each of the given tiers.
+
+    Returns {tier: jpeg bytes}.  Each halving starts from the one before, so
+    all of them together cost little more than the full frame.
+    """
+    jpegs = {}
+    planes = yuv420_planes(array, size)
+    scale = 1
+    for tier, (factor, quality) in TIERS.items():
+        if tier not in tiers:
+            continue
+        while scale < factor:
+            planes = tuple(halve_plane(p) for p in planes)
+            scale *= 2
+        jpegs[tier] = encode_planes(planes, quality)
+    return jpegs
+
+
+class AdaptiveTier:
+    """Picks the live view tier for one client from how fast it takes frames.
+
+    Call sent() after each frame.  A client drops a tier when frames take
+    longer than `budget` seconds to send.  How much bigger frames it could
+    take can't be measured from small ones that go out instantly, so it
+    tries the next tier up after a while, waiting twice as long each time
+    a try fails (up to a minute).
+    """
+    def __init__(self, budget=0.2, tier="full"):
+        self.budget = budget
+        self.tier = tier
+        self.send_time = 0.0  # seconds per frame at this tier, smoothed
+        self.backoff = 2.0
+        self.try_up_after = 0.0
+
+    def _move(self, step):
+        names = list(TIERS)
+        self.tier = names[names.index(self.tier) + step]
+        self.send_time = 0.0
+
+    def sent(self, seconds):
+        """Record a frame that took `seconds` to send; returns the next tier."""
+        now = time.monotonic()
+        self.send_time = 0.7 * self.send_time + 0.3 * seconds
+        names = list(TIERS)
+        if self.send_time > self.budget and self.tier != names[-1]:
+            self._move(1)
+            self.try_up_after = now + self.backoff
+            self.backoff = min(self.backoff * 2, 60.0)
+        elif (self.send_time < self.budget / 4 and self.tier != names[0]
+              and now > self.try_up_after):
+            self._move(-1)
+        return self.tier
@@ -0,0 +1,246 @@
+# Frame sources
+#
+# Everything app.py needs from a camera: lores YUV420 frames with their
+# metadata, full resolution snapshots, and the controls and properties the
+# UI shows.  PicameraSource is the real camera.  ReplaySource plays back a
+# directory of images, or an archive recorded on the Pi with
+#
+#   python framesource.py record night.npz --frames 300
+#
+# at a fixed frame rate, so the live view, the solver and the controls can
+# be exercised (and load tested) on a machine without a camera.
+
+import contextlib
+import io
+import json
+import os
+import threading
+import time
+
+import numpy as np
+from PIL import Image
+
+import frames
+
+# The lores stream feeds the live view and the solver; main is for snapshots
+LORES_SIZE = (640, 480)
+MAIN_SIZE = (1456, 1088)
+
+# What ReplaySource reports as its controls, as (min, max, default) like
+# Picamera2's camera_controls (these are the IMX296's)
+REPLAY_CONTROLS = {
+    "AeEnable": (False, True, True),
+    "AnalogueGain": (1.0, 16.0, 1.0),
+    "ExposureTime": (29, 15534385, 20000),
+    "ExposureValue": (-8.0, 8.0, 0.0),
+    "Brightness": (-1.0, 1.0, 0.0),
+    "Contrast": (0.0, 32.0, 1.0),
+    "Sharpness": (0.0, 16.0, 1.0),
+    "ScalerCrop": ((0, 0, 64, 64), (0, 0) + MAIN_SIZE, (0, 0) + MAIN_SIZE),
+}
+
+# EXIF tags Picamera2 writes into its JPEGs
+EXIF_IFD = 0x8769
+EXIF_EXPOSURE_TIME = 33434     # seconds
+EXIF_ISO = 34855               # analogue gain x 100
+
+
+class PicameraSource:
+    """The Pi camera, through Picamera2."""
+    def __init__(self, lores_size=LORES_SIZE, main_size=MAIN_SIZE):
+        from picamera2 import Picamera2, MappedArray
+        self._mapped_array = MappedArray
+        self.camera = Picamera2()
+        self.camera.configure(self.camera.create_still_configuration(
+            main={"size": main_size, "format": "RGB888"},
+            lores={"size": lores_size, "format": "YUV420"}))
+        self.camera.start()
+        self.properties = self.camera.camera_properties
+        self.camera_controls = self.camera.camera_controls
+
+    def controls(self):
+        """Current values of the controls that have been set."""
+        current = self.camera.controls
+        return {name: getattr(current, name) for name in self.camera_controls
+                if hasattr(current, name)}
+
+    def set_controls(self, controls):
+        self.camera.set_controls(controls)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Wait for the next frame; yields (lores YUV420 array, metadata).
+
+        The array is only valid inside the with block.
+        """
+        request = self.camera.capture_request()
+        try:
+            metadata = request.get_metadata()
+            with self._mapped_array(request, 'lores') as m:
+                yield m.array, metadata
+        finally:
+            request.release()
+
+    def capture_jpeg(self):
+        """Capture a full resolution JPEG."""
+        buffer = io.BytesIO()
+        self.camera.capture_file(buffer, name='main', format='jpeg')
+        return buffer.getvalue()
+
+    def close(self):
+        self.camera.close()
+
+
+def _image_metadata(image):
+    """ExposureTime (us) and AnalogueGain from a Picamera2 JPEG's EXIF."""
+    try:
+        exif = image.getexif().get_ifd(EXIF_IFD)
+    except Exception:
+        return {}
+    metadata = {}
+    if EXIF_EXPOSURE_TIME in exif:
+        metadata["ExposureTime"] = int(round(float(exif[EXIF_EXPOSURE_TIME]) * 1e6))
+    if EXIF_ISO in exif:
+        metadata["AnalogueGain"] = exif[EXIF_ISO] / 100
+    return metadata
+
+
+def load_directory(path, size):
+    """Read every image in a directory as (YUV420 arrays, metadata list)."""
+    names = sorted(f for f in os.listdir(path)
+                   if f.lower().endswith(('.jpg', '.jpeg', '.png')))
+    arrays, metadata = [], []
+    for name in names:
+        with Image.open(os.path.join(path, name)) as image:
+            arrays.append(frames.yuv420_from_image(image, size))
+            metadata.append(_image_metadata(image))
+    return arrays, metadata
+
+
+def load_archive(path, size):
+    """Read a recorded .npz archive as (YUV420 arrays, metadata list)."""
+    with np.load(path) as archive:
+        arrays = list(archive["frames"])
+        metadata = json.loads(str(archive["metadata"]))
+    width, height = size
+    if arrays and arrays[0].shape != (height * 3 // 2, width):
+        raise ValueError(f"{path} was recorded at a different lores size")
+    return arrays, metadata
+
+
+class ReplaySource:
+    """Plays frames from a directory or archive, looping, at `fps`.
+
+    Frames carry the exposure and gain they were recorded with when known,
+    and the current controls otherwise.  SensorTimestamp is when the frame
+    was "captured", on the same clock as the real camera's.
+    """
+    def __init__(self, path, lores_size=LORES_SIZE, main_size=MAIN_SIZE, fps=10.0):
+        if os.path.isdir(path):
+            self.frames, self.metadata = load_directory(path, lores_size)
+        else:
+            self.frames, self.metadata = load_archive(path, lores_size)
+        if not self.frames:
+            raise RuntimeError(f"No frames to replay in {path}")
+        self.lores_size = lores_size
+        self.main_size = main_size
+        self.interval = 1.0 / fps
+        self.properties = {"Model": f"replay of {os.path.basename(os.path.normpath(path))}",
+                           "PixelArraySize": main_size}
+        self.camera_controls = REPLAY_CONTROLS
+        self._controls = {name: default for name, (_, _, default) in REPLAY_CONTROLS.items()}
+        self._lock = threading.Lock()
+        self._index = 0
+        self._next_time = None
+        self._last = None
+
+    def controls(self):
+        with self._lock:
+            return dict(self._controls)
+
+    def set_controls(self, controls):
+        with self._lock:
+            self._controls.update(controls)
+
+    @contextlib.contextmanager
+    def capture(self):
+        """Wait for the next frame time; yields (lores YUV420 array, metadata)."""
+        with self._lock:
+            now = time.monotonic()
+            # After a pause, carry on from now rather than catching up
+            if self._next_time is None or self._next_time < now - self.interval:
+                self._next_time = now
+            wait = self._next_time - now
+            self._next_time += self.interval
+            i = self._index
+            self._index = (i + 1) % len(self.frames)
+            controls = dict(self._controls)
+        if wait > 0:
+            time.sleep(wait)
+        metadata = {
+            "ExposureTime": controls["ExposureTime"],
+            "AnalogueGain": controls["AnalogueGain"],
+            **self.metadata[i],
+            "FrameDuration": int(self.interval * 1e6),
+            "SensorTimestamp": frames.sensor_clock_ns(),
+        }
+        self._last = i
+        yield self.frames[i], metadata
+
+    def capture_jpeg(self):
+        """The last frame replayed, scaled up to the main stream's size."""
+        array = self.frames[self._last or 0]
+        image = frames.image_from_yuv420(array, self.lores_size).resize(self.main_size)
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+
+    def close(self):
+        pass
+
+
+def open_source(kind="auto", replay_path="test-images", replay_fps=10.0):
+    """Open a frame source: "picamera2", "replay", or "auto".
+
+    "auto" is the Pi camera when Picamera2 is installed, and a replay of
+    replay_path otherwise.
+    """
+    if kind == "auto":
+        try:
+            import picamera2  # noqa: F401
+            kind = "picamera2"
+        except ImportError:
+            print(f"Picamera2 is not installed, replaying {replay_path} instead")
+            kind = "replay"
+    if kind == "picamera2":
+        return PicameraSource()
+    if kind == "replay":
+        return ReplaySource(replay_path, fps=replay_fps)
+    raise ValueError(f"Unknown frame source {kind!r}")
+
+
+def record(path, count):
+    """Record `count` lores frames and their metadata from the Pi camera."""
+    source = PicameraSource()
+    arrays, metadata = [], []
+    try:
+        for _ in range(count):
+            with source.capture() as (array, frame_metadata):
+                arrays.append(array.copy())
+                metadata.append({key: frame_metadata[key] for key in ("ExposureTime", "AnalogueGain")
+                                 if key in frame_metadata})
+    finally:
+        source.close()
+    np.savez_compressed(path, frames=np.stack(arrays), metadata=json.dumps(metadata))
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="Record lores frames for ReplaySource.")
+    parser.add_argument("command", choices=["record"])
+    parser.add_argument("path", help="archive to write (.npz)")
+    parser.add_argument("--frames", type=int, default=100, help="how many frames to record")
+    args = parser.parse_args()
+    t0 = time.perf_counter()
+    record(args.path, args.frames)
+    print(f"Recorded {args.frames} frames to {args.path} in {time.perf_counter() - t0:.1f}s")
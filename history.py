@@ -0,0 +1,82 @@
+# Solve history
+#
+# Every published solve is appended to a fixed-size ring of NumPy records,
+# so a whole night of pointing can be kept and charted without the memory
+# growing or anyone parsing the strings the UI gets.  Records are numbered
+# in the order they were added (`id`), which is what readers page by;
+# `solve_id` can be out of order when solves finish out of order.
+
+import json
+import math
+import threading
+
+import numpy as np
+
+RECORD = np.dtype([
+    ("id", "<i8"),            # position in the history, from 1
+    ("solve_id", "<i8"),
+    ("time", "<f8"),          # Unix time the result was published
+    ("solved", "?"),
+    ("tracked", "?"),
+    ("ra", "<f8"),            # J2000 degrees, NaN if not solved
+    ("dec", "<f8"),
+    ("roll", "<f8"),
+    ("fov", "<f4"),
+    ("alt", "<f4"),
+    ("az", "<f4"),
+    ("matches", "<i4"),
+    ("frame_seq", "<i8"),     # 0 for test images
+    ("t_extract", "<f4"),     # ms, centroiding
+    ("t_solve", "<f4"),       # ms, tetra3 or tracking match
+    ("t_total", "<f4"),       # ms, from the solve starting to its result
+])
+
+
+# A record before anything is filled in: zeros, and NaN for coordinates
+BLANK = np.zeros((), dtype=RECORD)
+for _name in ("ra", "dec", "roll", "fov", "alt", "az"):
+    BLANK[_name] = np.nan
+
+
+class SolveHistory:
+    """Fixed-capacity ring of RECORDs, safe to use from several threads."""
+    def __init__(self, capacity=50000):
+        self.records = np.zeros(capacity, dtype=RECORD)
+        self.count = 0
+        self._condition = threading.Condition()
+
+    def append(self, **fields):
+        """Add a record; fields not given are zero (NaN for coordinates)."""
+        with self._condition:
+            i = self.count % len(self.records)
+            self.records[i] = BLANK
+            for name, value in fields.items():
+                self.records[name][i] = np.nan if value is None else value
+            self.count += 1
+            self.records["id"][i] = self.count
+            self._condition.notify_all()
+            return self.count
+
+    def since(self, after_id=0):
+        """Return a copy of the records with id > after_id, oldest first."""
+        with self._condition:
+            first = max(after_id, self.count - len(self.records), 0)
+            positions = np.arange(first, self.count) % len(self.records)
+            return self.records[positions]
+
+    def wait(self, after_id, timeout=None):
+        """Wait until there is a record newer than after_id; returns the last id."""
+        with self._condition:
+            self._condition.wait_for(lambda: self.count > after_id, timeout=timeout)
+            return self.count
+
+
+def to_json_lines(records):
+    """Format records as JSON lines, with NaN as null."""
+    names = records.dtype.names
+    lines = []
+    for values in records.tolist():
+        record = {name: (None if isinstance(value, float) and math.isnan(value) else value)
+                  for name, value in zip(names, values)}
+        lines.append(json.dumps(record) + "\n")
+    return "".join(lines)
@@ -1,11 +1,21 @@
 # I2C peripheral support module
+#
+# Each detected peripheral is read by its own Sampler thread at a fixed
+# rate, and the web app answers from the readings it keeps, so the bus
+# traffic is the same however many clients are polling /api/i2c.
 
+import collections
 import smbus2
+import threading
 import time
 
 # I2C bus number to use
 I2C_BUS = 1
 
+# Default readings per second for each peripheral, and how many are kept
+SAMPLE_RATE = 1.0
+SAMPLE_HISTORY = 60
+
 class I2CPeripheral:
     """Base class for an I2C peripheral."""
     def __init__(self, addr):
@@ -20,9 +30,13 @@ class I2CPeripheral:
         except Exception:
             return False
 
+    def read_all(self):
+        """Read every value at once; returns (time.time(), {name: value})."""
+        raise NotImplementedError
+
     def get_value(self, name):
         """Get a named value from the peripheral."""
-        raise NotImplementedError
+        return self.read_all()[1].get(name)
 
     def get_value_names(self):
         """Get a list of value names for the peripheral."""
@@ -49,18 +63,25 @@ class INA219(I2CPeripheral):
         # Calibrate for 32V, 2A
         self.bus.write_i2c_block_data(self.addr, self.INA219_REG_CALIBRATION, [0x10, 0x00])
 
-    def get_value(self, name):
-        if name == "voltage":
-            value = self.bus.read_i2c_block_data(self.addr, self.INA219_REG_BUSVOLTAGE, 2)
-            return ((value[0] << 8) | value[1]) >> 3 * 4 / 1000.0
-        elif name == "current":
-            value = self.bus.read_i2c_block_data(self.addr, self.INA219_REG_CURRENT, 2)
-            return ((value[0] << 8) | value[1]) / 1000.0
-        elif name == "power":
-            value = self.bus.read_i2c_block_data(self.addr, self.INA219_REG_POWER, 2)
-            return ((value[0] << 8) | value[1]) * 20 / 1000.0
-        else:
-            return None
+    def _read_register(self, reg):
+        value = self.bus.read_i2c_block_data(self.addr, reg, 2)
+        return (value[0] << 8) | value[1]
+
+    def read_all(self):
+        # The INA219 doesn't auto-increment its register pointer, so each
+        # register is its own 2 byte read; power and current are read
+        # straight after the voltage so they come from the same conversion.
+        t = time.time()
+        bus = self._read_register(self.INA219_REG_BUSVOLTAGE)
+        power = self._read_register(self.INA219_REG_POWER)
+        current = self._read_register(self.INA219_REG_CURRENT)
+        if current & 0x8000:
+            current -= 0x10000
+        return t, {
+            "voltage": (bus >> 3) * 4 / 1000.0,  # 4 mV per bit
+            "current": current / 1000.0,
+            "power": power * 20 / 1000.0,
+        }
 
     def get_value_names(self):
         return ["voltage", "current", "power"]
@@ -73,30 +94,24 @@ class DS3231(I2CPeripheral):
     def _bcd_to_dec(self, bcd):
         return (bcd // 16 * 10) + (bcd % 16)
 
-    def get_value(self, name):
-        if name == "datetime":
-            try:
-                data = self.bus.read_i2c_block_data(self.addr, 0x00, 7)
-                sec = self._bcd_to_dec(data[0])
-                min = self._bcd_to_dec(data[1])
-                hour = self._bcd_to_dec(data[2] & 0x3F)
-                day = self._bcd_to_dec(data[4])
-                month = self._bcd_to_dec(data[5])
-                year = self._bcd_to_dec(data[6]) + 2000
-                return f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{min:02d}:{sec:02d}"
-            except Exception:
-                return None
-        elif name == "temperature":
-            try:
-                data = self.bus.read_i2c_block_data(self.addr, 0x11, 2)
-                temp = (data[0] << 8 | data[1]) >> 6
-                if data[0] & 0x80:
-                    temp -= 256
-                return temp * 0.25
-            except Exception:
-                return None
-        else:
-            return None
+    def read_all(self):
+        # Registers 0x00-0x12 in one read: the time, then the alarms and
+        # control registers, then the temperature at 0x11
+        t = time.time()
+        data = self.bus.read_i2c_block_data(self.addr, 0x00, 0x13)
+        sec = self._bcd_to_dec(data[0])
+        min = self._bcd_to_dec(data[1])
+        hour = self._bcd_to_dec(data[2] & 0x3F)
+        day = self._bcd_to_dec(data[4])
+        month = self._bcd_to_dec(data[5] & 0x1F)
+        year = self._bcd_to_dec(data[6]) + 2000
+        temp = (data[0x11] << 8 | data[0x12]) >> 6
+        if data[0x11] & 0x80:
+            temp -= 1024
+        return t, {
+            "datetime": f"{year:04d}-{month:02d}-{day:02d} {hour:02d}:{min:02d}:{sec:02d}",
+            "temperature": temp * 0.25,
+        }
 
     def get_value_names(self):
         return ["datetime", "temperature"]
@@ -108,6 +123,11 @@ class BME280(I2CPeripheral):
 
     def init(self):
         self._load_calibration_data()
+        # Set oversampling and mode once; in normal mode the sensor keeps
+        # measuring on its own and read_all() just collects the result
+        self.bus.write_byte_data(self.addr, 0xF2, 1)  # Humidity oversampling x1
+        self.bus.write_byte_data(self.addr, 0xF4, 0x27) # Temp/Pressure oversampling x1, normal mode
+        self.bus.write_byte_data(self.addr, 0xF5, 0xA0) # Standby 1000ms, filter off
 
     def _load_calibration_data(self):
         # Read calibration data from the sensor
@@ -150,14 +170,10 @@ class BME280(I2CPeripheral):
         self.dig_H6 = calib[31]
         if self.dig_H6 & 0x80: self.dig_H6 = (-self.dig_H6 ^ 0xFF) + 1
 
-    def get_value(self, name):
-        """Get a named value from the peripheral."""
-        # Set oversampling and mode
-        self.bus.write_byte_data(self.addr, 0xF2, 1)  # Humidity oversampling x1
-        self.bus.write_byte_data(self.addr, 0xF4, 0x27) # Temp/Pressure oversampling x1, normal mode
-        self.bus.write_byte_data(self.addr, 0xF5, 0xA0) # Standby 1000ms, filter off
-
-        # Read raw data
+    def read_all(self):
+        # Pressure, temperature and humidity in one burst, so all three come
+        # from the same measurement
+        t = time.time()
         data = self.bus.read_i2c_block_data(self.addr, 0xF7, 8)
         raw_press = (data[0] << 12) | (data[1] << 4) | (data[2] >> 4)
         raw_temp = (data[3] << 12) | (data[4] << 4) | (data[5] >> 4)
@@ -196,39 +212,149 @@ class BME280(I2CPeripheral):
         elif humidity < 0:
             humidity = 0
 
-        if name == "temperature":
-            return temp
-        elif name == "pressure":
-            return pressure
-        elif name == "humidity":
-            return humidity
-        else:
-            return None
+        return t, {"temperature": temp, "humidity": humidity, "pressure": pressure}
 
     def get_value_names(self):
         return ["temperature", "humidity", "pressure"]
 
-# Dictionary to hold detected peripherals
+class Sampler:
+    """Reads one peripheral with read_all() `rate` times a second.
+
+    The last `history` readings are kept as (time.time(), time.monotonic(),
+    values) tuples, newest last.
+    """
+    def __init__(self, name, peripheral, rate=SAMPLE_RATE, history=SAMPLE_HISTORY):
+        self.name = name
+        self.peripheral = peripheral
+        self.interval = 1.0 / rate
+        self.readings = collections.deque(maxlen=history)
+        self.errors = 0
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=f"i2c {self.name}", daemon=True)
+            self._thread.start()
+
+    def sample(self):
+        """Read the peripheral once and keep the reading."""
+        wall, values = self.peripheral.read_all()
+        with self._lock:
+            self.readings.append((wall, time.monotonic(), values))
+
+    def _run(self):
+        next_time = time.monotonic()
+        while True:
+            try:
+                self.sample()
+                # Keep to the rate, but don't try to catch up after a slow read
+                next_time = max(next_time + self.interval, time.monotonic())
+                delay = next_time - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                    self.last_error = str(e)
+                next_time = time.monotonic() + self.interval
+                time.sleep(self.interval)
+
+    def latest(self):
+        """The newest reading, or None before the first one."""
+        with self._lock:
+            return self.readings[-1] if self.readings else None
+
+    def history(self):
+        with self._lock:
+            return list(self.readings)
+
+    def status(self, history=False):
+        """The newest values with their age in seconds, for /api/i2c.
+
+        A reading is stale once three samples in a row have been missed.
+        """
+        reading = self.latest()
+        with self._lock:
+            status = {"errors": self.errors, "last_error": self.last_error}
+        if reading is None:
+            status.update(values=None, time=None, age=None, stale=True)
+        else:
+            wall, mono, values = reading
+            age = time.monotonic() - mono
+            status.update(values=values, time=wall, age=round(age, 3),
+                          stale=age > 3 * self.interval)
+        if history:
+            status["history"] = [{"time": wall, "values": values}
+                                 for wall, _, values in self.history()]
+        return status
+
+# Dictionary to hold detected peripherals, and their samplers
 peripherals = {}
+samplers = {}
 
 def init_peripherals():
     """Detect and initialize I2C peripherals."""
+    global peripherals
+    # This runs in the background while requests read peripherals, so
+    # build the dict here and publish it with one assignment
+    found = {}
+
     # INA219
     ina219 = INA219()
     if ina219.is_present():
         ina219.init()
-        peripherals["ina219"] = ina219
+        found["ina219"] = ina219
 
     # DS3231
     ds3231 = DS3231()
     if ds3231.is_present():
-        peripherals["ds3231"] = ds3231
+        found["ds3231"] = ds3231
 
     # BME280
     bme280 = BME280()
     if bme280.is_present():
         bme280.init()
-        peripherals["bme280"] = bme280
+        found["bme280"] = bme280
+
+    peripherals = found
+
+def start_samplers(rate=SAMPLE_RATE, history=SAMPLE_HISTORY):
+    """Start a background Sampler for every detected peripheral."""
+    global samplers
+    # Request threads iterate samplers, so swap in a new dict, never grow it
+    started = dict(samplers)
+    for name, peripheral in peripherals.items():
+        if name not in started:
+            started[name] = Sampler(name, peripheral, rate, history)
+            started[name].start()
+    samplers = started
+
+def read_all_peripherals(history=False):
+    """Read every detected peripheral now, one read_all() each.
+
+    Returns the same keys as Sampler.status(), for a reading of age 0; a
+    peripheral that couldn't be read has no values and one error.
+    """
+    readings = {}
+    for name, peripheral in peripherals.items():
+        try:
+            t, values = peripheral.read_all()
+            status = {"errors": 0, "last_error": None,
+                      "values": values, "time": t, "age": 0.0, "stale": False}
+        except Exception as e:
+            status = {"errors": 1, "last_error": str(e),
+                      "values": None, "time": None, "age": None, "stale": True}
+        if history:
+            status["history"] = ([] if status["values"] is None
+                                 else [{"time": status["time"], "values": status["values"]}])
+        readings[name] = status
+    return readings
+
+def get_sampled_status(history=False):
+    """Cached readings of every sampled peripheral; no bus traffic."""
+    return {name: sampler.status(history) for name, sampler in samplers.items()}
 
 def get_peripheral_value(peripheral_name, value_name):
     """Get a value from a peripheral."""
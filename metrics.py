@@ -0,0 +1,173 @@
+# Instrumentation
+#
+# Counters and histograms for the capture loop, the solver and the web
+# handlers, served in Prometheus text format at /metrics.  Each metric has
+# its own lock, held only for a few additions, so threads recording
+# different things never wait on each other.
+#
+# Counters also keep per-second buckets for the last few seconds, which is
+# where the FPS figures in the UI come from (see Counter.rate()).
+
+import bisect
+import math
+import threading
+import time
+
+# Everything created here, in creation order, for render()
+REGISTRY = []
+
+# Seconds of per-second buckets kept for Counter.rate()
+RATE_HISTORY = 10
+
+# Default histogram buckets, in seconds: 1 ms to 10 s
+TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Metric:
+    """Base for metrics with optional labels.
+
+    A metric with labelnames is a family: record through
+    metric.labels(name=value), which returns (and remembers) the child for
+    that combination of values.
+    """
+    kind = None
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, **options):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.options = options
+        self._lock = threading.Lock()
+        self._children = {}
+        if registry is not None:
+            registry.append(self)
+
+    def labels(self, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.get(key)
+                if child is None:
+                    child = type(self)(self.name, self.help, registry=None, **self.options)
+                    self._children[key] = child
+        return child
+
+    def children(self):
+        """Yield (labels dict, metric) for each sample source."""
+        if not self.labelnames:
+            yield {}, self
+            return
+        for key, child in list(self._children.items()):
+            yield dict(zip(self.labelnames, key)), child
+
+
+class Counter(Metric):
+    """A count that only goes up.  By convention its name ends in _total."""
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY):
+        super().__init__(name, help, labelnames, registry)
+        self.value = 0
+        self._buckets = [0] * RATE_HISTORY
+        self._bucket_seconds = [0] * RATE_HISTORY
+
+    def inc(self, amount=1):
+        second = int(time.monotonic())
+        i = second % RATE_HISTORY
+        with self._lock:
+            self.value += amount
+            if self._bucket_seconds[i] != second:
+                self._bucket_seconds[i] = second
+                self._buckets[i] = 0
+            self._buckets[i] += amount
+
+    def rate(self, window=5):
+        """Average per-second rate over the last `window` whole seconds.
+
+        For a family, the sum over all its children.
+        """
+        if self.labelnames:
+            return sum(child.rate(window) for _, child in self.children())
+        now = int(time.monotonic())
+        window = min(window, RATE_HISTORY - 1)
+        with self._lock:
+            total = sum(count for count, second in zip(self._buckets, self._bucket_seconds)
+                        if now - window <= second < now)
+        return total / window
+
+    def samples(self):
+        yield "", {}, self.value
+
+
+class Histogram(Metric):
+    """Counts of observations in cumulative buckets, with their sum."""
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), registry=REGISTRY, buckets=TIME_BUCKETS):
+        super().__init__(name, help, labelnames, registry, buckets=buckets)
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def time(self):
+        """Context manager that observes how long its block took."""
+        return _Timer(self)
+
+    def samples(self):
+        with self._lock:
+            counts = list(self.counts)
+            total, count = self.sum, self.count
+        cumulative = 0
+        for bound, n in zip(self.buckets + (math.inf,), counts):
+            cumulative += n
+            yield "_bucket", {"le": _format_value(bound)}, cumulative
+        yield "_sum", {}, total
+        yield "_count", {}, count
+
+
+class _Timer:
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+               for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+def render(registry=REGISTRY):
+    """Return every metric in Prometheus text exposition format."""
+    lines = []
+    for metric in registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for labels, child in metric.children():
+            for suffix, extra, value in child.samples():
+                lines.append(f"{metric.name}{suffix}{_format_labels({**labels, **extra})} "
+                             f"{_format_value(value)}")
+    return "\n".join(lines) + "\n"
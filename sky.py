@@ -0,0 +1,104 @@
+# What's up: where every named star is, all at once
+#
+# Instead of one ephem.FixedBody per object, SkyIndex keeps the catalog's
+# RA/Dec as arrays and works out alt/az and hour angle for all of them in
+# one vectorised pass, at most once a second.  Positions are precessed from
+# J2000 to the date; nutation, aberration and refraction are left out,
+# which keeps us within about an arcminute of ephem (well inside a finder's
+# field), except near the horizon where refraction lifts things ~0.5 deg.
+
+import math
+import threading
+import time
+
+import numpy as np
+
+
+def julian_date(t):
+    """Julian date for a Unix time."""
+    return t / 86400.0 + 2440587.5
+
+
+def sidereal_time(t, lon):
+    """Local mean sidereal time in degrees, for a Unix time and east longitude."""
+    d = julian_date(t) - 2451545.0
+    c = d / 36525.0
+    gmst = 280.46061837 + 360.98564736629 * d + 0.000387933 * c * c - c ** 3 / 38710000.0
+    return (gmst + lon) % 360
+
+
+def precess(ra, dec, t):
+    """Precess J2000 RA/Dec (degrees) to the equinox of date (Meeus 21.4)."""
+    c = (julian_date(t) - 2451545.0) / 36525.0
+    zeta = math.radians((2306.2181 * c + 0.30188 * c * c + 0.017998 * c ** 3) / 3600)
+    z = math.radians((2306.2181 * c + 1.09468 * c * c + 0.018203 * c ** 3) / 3600)
+    theta = math.radians((2004.3109 * c - 0.42665 * c * c - 0.041833 * c ** 3) / 3600)
+    ra = np.radians(ra) + zeta
+    dec = np.radians(dec)
+    a = np.cos(dec) * np.sin(ra)
+    b = math.cos(theta) * np.cos(dec) * np.cos(ra) - math.sin(theta) * np.sin(dec)
+    c = math.sin(theta) * np.cos(dec) * np.cos(ra) + math.cos(theta) * np.sin(dec)
+    return (np.degrees(np.arctan2(a, b) + z) % 360,
+            np.degrees(np.arctan2(c, np.hypot(a, b))))
+
+
+def horizontal(ra, dec, lst, lat):
+    """Return (alt, az, hour angle) in degrees for RA/Dec of date.
+
+    Azimuth is from north through east; hour angle is in (-180, 180].
+    """
+    ha = (lst - np.asarray(ra) + 180) % 360 - 180
+    h = np.radians(ha)
+    d = np.radians(dec)
+    phi = math.radians(lat)
+    alt = np.arcsin(np.clip(math.sin(phi) * np.sin(d) + math.cos(phi) * np.cos(d) * np.cos(h), -1, 1))
+    az = np.arctan2(-np.cos(d) * np.sin(h),
+                    np.sin(d) * math.cos(phi) - np.cos(d) * math.sin(phi) * np.cos(h))
+    return np.degrees(alt), np.degrees(az) % 360, ha
+
+
+class SkyNow:
+    """Where the catalog is at one moment: arrays in catalog order."""
+    def __init__(self, t, lst, alt, az, ha):
+        self.time = t
+        self.lst = lst
+        self.alt = alt
+        self.az = az
+        self.ha = ha
+
+
+class SkyIndex:
+    """Alt/az of a whole catalog for an observer, cached per second.
+
+    `ra` and `dec` are J2000 degrees (NaN for unknown positions), as in
+    catalog.Catalog.  Safe to use from several threads.
+    """
+    def __init__(self, lat, lon, ra, dec):
+        self.lat = lat
+        self.lon = lon
+        self.ra = np.asarray(ra, dtype=np.float64)
+        self.dec = np.asarray(dec, dtype=np.float64)
+        self._lock = threading.Lock()
+        self._now = None
+
+    def sidereal_time(self, t=None):
+        """Local sidereal time in degrees (from the same per-second cache)."""
+        return self.at(t).lst
+
+    def at(self, t=None):
+        """Return the SkyNow for time t (default now), to the second."""
+        second = int(time.time() if t is None else t)
+        with self._lock:
+            if self._now is None or self._now.time != second:
+                lst = sidereal_time(second, self.lon)
+                ra, dec = precess(self.ra, self.dec, second)
+                with np.errstate(invalid='ignore'):
+                    alt, az, ha = horizontal(ra, dec, lst, self.lat)
+                self._now = SkyNow(second, lst, alt, az, ha)
+            return self._now
+
+    def horizontal(self, ra, dec, t=None):
+        """Return (alt, az, hour angle) in degrees for J2000 RA/Dec."""
+        t = time.time() if t is None else t
+        ra, dec = precess(ra, dec, t)
+        return horizontal(ra, dec, self.at(t).lst, self.lat)
@@ -0,0 +1,254 @@
+# Plate solving pipeline stages
+#
+# These run in worker processes (see solve_pool in app.py), so they only
+# take and return picklable things: numpy arrays, dicts and bytes.
+#
+# tetra3 takes seconds to import on a Pi, so importing this module doesn't
+# load it.  Each worker loads the tetra3 database, the font and the
+# catalogs once, on first use or from warm_up(), and records what each of
+# those cost in load_times, and why any of them failed in load_errors.
+
+import functools
+import importlib
+import io
+import math
+import os
+import time
+import numpy as np
+# This is needed for some reason...
+np.math = math
+from PIL import Image, ImageDraw, ImageFont
+import catalog
+import tanwcs
+import tracking
+
+DISTORTION = -0.003857906866170312
+
+font_path = "/usr/share/fonts/truetype/noto/NotoSansDisplay-Regular.ttf"
+font_size = 12
+
+# Per-process state, filled in by load_solver() and load_annotation()
+tetra3 = None
+tetra = None
+font = None
+labels = {}
+constellation_boundaries = None
+load_times = {}
+load_errors = {}
+
+def load_catalogs():
+    """Map the star labels and constellation boundaries from the catalog cache."""
+    global labels, constellation_boundaries
+    cat = catalog.load()
+    labels = cat.labels
+    constellation_boundaries = cat.boundaries
+
+def _timed(name, load):
+    t0 = time.perf_counter()
+    result = load()
+    load_times[name] = round((time.perf_counter() - t0) * 1000, 1)
+    return result
+
+def load_solver():
+    """Import tetra3 and load its database, unless already done."""
+    global tetra3, tetra
+    if tetra is None:
+        tetra3 = _timed("import tetra3", lambda: importlib.import_module("tetra3"))
+        tetra = _timed("tetra3 database", tetra3.Tetra3)
+
+def _load_font():
+    try:
+        return ImageFont.truetype(font_path, font_size)
+    except OSError as e:
+        # Not every machine has the Noto fonts; labels still work without them
+        load_errors["font"] = f"{font_path}: {e}; using PIL's default font"
+        print(f"Could not load {font_path} ({e}), using PIL's default font")
+        return ImageFont.load_default()
+
+def load_annotation():
+    """Load the font and catalogs, unless already done (or already failed).
+
+    Never raises: without the catalogs, stars are labelled with their ids
+    and there are no boundaries.
+    """
+    global font
+    if font is None:
+        font = _timed("font", _load_font)
+    if constellation_boundaries is None and "catalogs" not in load_errors:
+        try:
+            _timed("catalogs", load_catalogs)
+        except Exception as e:
+            load_errors["catalogs"] = str(e)
+            print(f"Could not load the catalogs: {e}")
+
+def warm_up():
+    """Load everything a worker needs; returns (pid, load_times, load_errors).
+
+    Each step is tried even if an earlier one failed, so one bad file
+    doesn't hide whether the rest loaded.
+    """
+    try:
+        load_solver()
+    except Exception as e:
+        load_errors["tetra3"] = str(e)
+        print(f"Could not load tetra3: {e}")
+    load_annotation()
+    return os.getpid(), dict(load_times), dict(load_errors)
+
+@functools.lru_cache(maxsize=1024)
+def label_sprite(catid, label_font):
+    """Render a star's label once, as a mask to paste onto solved fields.
+
+    Returns (mask, (dx, dy)), where (dx, dy) is where the mask's corner
+    sits relative to the point draw.text() would have been given.
+    """
+    text = labels.get(catid, str(catid))
+    left, top, right, bottom = label_font.getbbox(text)
+    mask = Image.new('L', (max(right - left, 1), max(bottom - top, 1)))
+    ImageDraw.Draw(mask).text((-left, -top), text, fill=255, font=label_font)
+    return mask, (left, top)
+
+def solve_luminance(luminance, seed=None, **kwargs):
+    """Centroid a 2D luminance array and solve it.
+
+    This feeds the array straight to tetra3's centroiding, without the
+    JPEG encode/decode that going through solve_from_image needs.  Given
+    the `seed` solution of a recent frame, it first tries to track from it
+    (see tracking.py), and only does a full tetra3 solve if that fails.
+    """
+    load_solver()
+    t0 = time.perf_counter()
+    centroids = tetra3.get_centroids_from_image(luminance)
+    t_extract = (time.perf_counter() - t0) * 1000
+    height, width = luminance.shape[:2]
+    solution = None
+    if seed is not None and len(centroids):
+        try:
+            solution = tracking.track(centroids, (height, width), seed,
+                    tetra.star_table, tetra.star_catalog_IDs, distortion=DISTORTION)
+        except Exception as e:
+            print(f"Tracking failed: {e}")
+    if solution is None:
+        solution = tetra.solve_from_centroids(centroids, (height, width),
+                distortion=DISTORTION, **kwargs)
+    solution['T_extract'] = t_extract
+    solution['centroids'] = np.asarray(centroids, dtype=np.float32)
+    return solution
+
+def is_solved(solution):
+    return bool(solution) and solution.get('RA') is not None \
+        and solution.get('Dec') is not None and solution.get('Roll') is not None
+
+def solve_frame(luminance, seed=None):
+    """Solve a frame, returning tetra3's solution dict.
+
+    Only the numbers come back: the centroids, the matched stars and their
+    ids, and a TanWCS fitted to them.  Drawing them is left to
+    render_solved_field(), on demand.
+    """
+    solution = solve_luminance(luminance, seed=seed, return_matches=True)
+    if is_solved(solution):
+        try:
+            solution['wcs'] = tanwcs.fit_solution(solution, sip_degree=2)
+        except (ValueError, np.linalg.LinAlgError) as e:
+            print(f"Could not fit WCS: {e}")
+    return solution
+
+def encode_jpeg(image):
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG')
+    return buf.getvalue()
+
+def solution_wcs(solution):
+    """Return the solution's WCS, fitting it if the solve didn't."""
+    wcs = solution.get('wcs')
+    if wcs is None:
+        # We asked the solver to return the list of matched stars, with
+        # both the pixel position and the RA/Dec of each.  From the two we
+        # fit a TAN projection, with SIP terms for the lens distortion.
+        wcs = tanwcs.fit_solution(solution, sip_degree=2)
+    return wcs
+
+# What render_solved_field() can draw; /solved_field.jpg picks from these
+OVERLAYS = ("centroids", "labels", "boundaries")
+
+def draw_centroids(draw, solution):
+    """Mark what the solver saw: every centroid, and the ones it matched."""
+    for y, x in solution.get("centroids", []):
+        draw.ellipse([(x - 4, y - 4), (x + 4, y + 4)], outline=(128,128,128))
+    for y, x in solution.get("matched_centroids", []):
+        draw.ellipse([(x - 6, y - 6), (x + 6, y + 6)], outline=(0,255,0))
+
+def draw_labels(image, draw, solution):
+    """Label the matched stars.
+
+    Labels come from the sprite cache, so each star's text is only
+    rasterised the first time we see it.
+    """
+    load_annotation()
+    for id, p in zip(solution.get("matched_catID") or [], solution.get("matched_centroids") or []):
+        try:
+            # not sure why x and y are swapped here...
+            p = (int(p[1]) + 8, int(p[0]) - 8)
+            if isinstance(id, (int, np.integer)):
+                mask, (dx, dy) = label_sprite(int(id), font)
+                image.paste((255,255,255), (p[0] + dx, p[1] + dy), mask)
+            else:
+                draw.text(p, f"{id}", fill=(255,255,255), font=font)
+        except Exception:
+            pass
+
+def project_boundaries(solution, wcs, size):
+    """Project the constellation boundaries that cross the field to pixels.
+
+    Returns (x1, y1, x2, y2) arrays, one entry per segment.  The index hands
+    us just the segments near the field, and all their endpoints get
+    projected in one go.
+    """
+    load_annotation()
+    if constellation_boundaries is None:
+        return (np.empty(0),) * 4
+    height, width = size
+    fov = solution.get('FOV') or 20.0
+    radius = 0.5 * fov * math.hypot(width, height) / width
+    start, end = constellation_boundaries.segments_near(solution['RA'], solution['Dec'], radius)
+    vertices = np.concatenate([start, end])
+    px, py = wcs.world_to_pixel(constellation_boundaries.ra[vertices],
+                                constellation_boundaries.dec[vertices])
+    n = len(start)
+    return px[:n], py[:n], px[n:], py[n:]
+
+def draw_boundaries(draw, segments):
+    for x1, y1, x2, y2 in zip(*segments):
+        if np.isfinite(x1) and np.isfinite(y1) and np.isfinite(x2) and np.isfinite(y2):
+            # relies on clipping from the ImageDraw library...
+            draw.line([(x1, y1), (x2, y2)], fill="yellow", width=1)
+
+def render_solved_field(image, solution, overlays=OVERLAYS):
+    """Draw a solution over its frame, as JPEG bytes.
+
+    `image` is the frame that was solved (2D luminance or RGB array).  If the
+    solve failed, the frame is returned as is so the UI can still show it.
+    This only runs when someone asks for the picture (see /solved_field.jpg).
+    """
+    img = Image.fromarray(image)
+    if not is_solved(solution):
+        return encode_jpeg(img)
+    combined_image = img.convert('RGB')
+    draw = ImageDraw.Draw(combined_image)
+
+    if "centroids" in overlays:
+        draw_centroids(draw, solution)
+
+    # okay, MTV - draw annotations.
+    if "labels" in overlays:
+        draw_labels(combined_image, draw, solution)
+
+    if "boundaries" in overlays:
+        try:
+            wcs = solution_wcs(solution)
+            draw_boundaries(draw, project_boundaries(solution, wcs, image.shape[:2]))
+        except Exception as e:
+            print(f"EXCEPTION DURING WCS HANDLING: {e}")
+
+    return encode_jpeg(combined_image)
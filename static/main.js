@@ -3,6 +3,10 @@ document.addEventListener('DOMContentLoaded', (event) => {
     const fpsDisplay = document.getElementById('fps_display');
     const videoModeSelect = document.getElementById('video_mode_select');
     const videoModeOverlay = document.getElementById('video_mode_overlay');
+    const streamTierSelect = document.getElementById('stream_tier_select');
+    const autoSolveCheckbox = document.getElementById('auto_solve_checkbox');
+    const autoSolveRateSelect = document.getElementById('auto_solve_rate_select');
+    const autoSolveStats = document.getElementById('auto_solve_stats');
     const radecContainer = document.getElementById('radec-container');
     const raDisplay = document.getElementById('ra-display');
     const decDisplay = document.getElementById('dec-display');
@@ -13,6 +17,17 @@ document.addEventListener('DOMContentLoaded', (event) => {
 
     let currentVideoMode = 'live'; // Default to live mode
     let isSolving = false; // Flag to prevent multiple simultaneous solves
+    let autoSolveStartedHere = false; // The Solved view turned auto-solve on
+    let latestStatus = null; // Last snapshot received from /events
+    let solveIdAtRequest = null; // solve_id when we asked for a solve
+    let shownSolveId = null; // solve_id of the result on screen
+
+    // Live view tier: auto follows the connection, or pick a size
+    streamTierSelect.value = localStorage.getItem('streamTier') || 'auto';
+    streamTierSelect.addEventListener('change', () => {
+        localStorage.setItem('streamTier', streamTierSelect.value);
+        updateVideoFeed();
+    });
 
     function updateVideoModeOverlay() {
         if (videoModeOverlay) {
@@ -22,17 +37,27 @@ document.addEventListener('DOMContentLoaded', (event) => {
 
     videoModeSelect.addEventListener('change', () => {
         currentVideoMode = videoModeSelect.value;
+        solvedFieldEtag = null; // the image element no longer shows it
         updateVideoModeOverlay();
         updateVideoFeed(); // Update the feed immediately
+        updateFpsDisplay();
         if (currentVideoMode === 'live') {
             videoModeOverlay.classList.remove('solve-success', 'solve-fail');
             radecContainer.style.display = 'none';
             matchedStarsOverlay.innerText = '';
             matchedStarsOverlay.style.display = 'none'; // Hide the overlay
+            if (autoSolveStartedHere) {
+                autoSolveCheckbox.checked = false;
+                sendAutoSolve();
+            }
         } else if (currentVideoMode === 'solved') {
             radecContainer.style.display = 'block';
-            if (!isSolving) {
-                solveField();
+            // The Solved view keeps solving: have the server's auto-solve do
+            // it, and turn it off again when we leave if we turned it on
+            if (!autoSolveCheckbox.checked) {
+                autoSolveCheckbox.checked = true;
+                sendAutoSolve();
+                autoSolveStartedHere = true;
             }
         }
     });
@@ -40,33 +65,112 @@ document.addEventListener('DOMContentLoaded', (event) => {
     function updateVideoFeed() {
         if (videoFeedImg) {
             if (currentVideoMode === 'live') {
-                videoFeedImg.src = '/video_feed?t=' + new Date().getTime();
+                // The MJPEG stream pushes frames by itself, so only attach it once.
+                const streamUrl = '/stream?tier=' + streamTierSelect.value;
+                if (!videoFeedImg.src.endsWith(streamUrl)) {
+                    videoFeedImg.src = streamUrl;
+                }
             } else {
-                videoFeedImg.src = '/solved_field.jpg?t=' + new Date().getTime();
+                updateSolvedField();
             }
         }
     }
 
-    // Update video feed and FPS every 100ms (adjust as needed)
-    setInterval(() => {
-        updateVideoFeed();
-        fetch('/get_pause_state') // New endpoint to get pause state
-            .then(response => response.json())
-            .then(data => {
-                if (data.is_paused) {
-                    fpsDisplay.innerText = 'FPS: Paused';
-                } else if (fpsDisplay) {
-                    const fps_url = currentVideoMode === 'live' ? '/get_fps' : '/get_solve_fps';
-                    fetch(fps_url)
-                        .then(response => response.json())
-                        .then(data => {
-                            fpsDisplay.innerText = `FPS: ${data.fps}`;
-                        })
-                        .catch(error => console.error('Error fetching FPS:', error));
-                }
+    // The solved field only changes when a solve finishes, so poll it with
+    // If-None-Match: the server answers 304 until there is a new one, and
+    // the image is only swapped when there is.
+    let solvedFieldEtag = null;
+    let solvedFieldUrl = null;
+    let solvedFieldPending = false;
+
+    function updateSolvedField() {
+        if (solvedFieldPending) {
+            return;
+        }
+        solvedFieldPending = true;
+        const headers = solvedFieldEtag ? {'If-None-Match': solvedFieldEtag} : {};
+        fetch('/solved_field.jpg', {headers: headers, cache: 'no-store'})
+        .then(response => {
+            if (response.status !== 200) {
+                return null; // 304: ours is current; 404: nothing solved yet
+            }
+            solvedFieldEtag = response.headers.get('ETag');
+            return response.blob();
+        })
+        .then(blob => {
+            if (!blob || currentVideoMode !== 'solved') {
+                return;
+            }
+            if (solvedFieldUrl) {
+                URL.revokeObjectURL(solvedFieldUrl);
+            }
+            solvedFieldUrl = URL.createObjectURL(blob);
+            videoFeedImg.src = solvedFieldUrl;
+        })
+        .catch(error => {
+            console.error('Error:', error);
+        })
+        .finally(() => {
+            solvedFieldPending = false;
+        });
+    }
+
+    // Update the solved field image every 100ms (adjust as needed)
+    setInterval(updateVideoFeed, 100);
+
+    function updateFpsDisplay() {
+        if (!fpsDisplay || !latestStatus) {
+            return;
+        }
+        if (latestStatus.is_paused) {
+            fpsDisplay.innerText = 'FPS: Paused';
+        } else {
+            const fps = currentVideoMode === 'live' ? latestStatus.fps : latestStatus.solve_fps;
+            fpsDisplay.innerText = `FPS: ${fps}`;
+        }
+    }
+
+    // The server pushes a status snapshot whenever something in it changes.
+    const statusEvents = new EventSource('/events');
+    statusEvents.onmessage = (event) => {
+        latestStatus = JSON.parse(event.data);
+        updateFpsDisplay();
+        document.getElementById('cpu-temp').innerText = latestStatus.cpu_temp;
+        document.getElementById('cpu-load').innerText = latestStatus.cpu_load;
+        updateAutoSolve(latestStatus);
+        handleSolveStatus(latestStatus);
+    };
+
+    // Auto-solve runs on the server; every open page shows (and can change)
+    // the same setting.
+    function updateAutoSolve(status) {
+        autoSolveCheckbox.checked = status.auto_solve;
+        if (!status.auto_solve) {
+            autoSolveStartedHere = false;
+        }
+        if (document.activeElement !== autoSolveRateSelect) {
+            autoSolveRateSelect.value = String(status.auto_solve_rate);
+        }
+        autoSolveStats.innerText = status.auto_solve ?
+            `${status.solve_fps}/s, ${status.skipped_frames} frames skipped` : '';
+    }
+
+    function sendAutoSolve() {
+        autoSolveStartedHere = false; // whoever calls this decides from here on
+        fetch('/set_auto_solve', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({
+                auto_solve: autoSolveCheckbox.checked,
+                rate: parseFloat(autoSolveRateSelect.value)
             })
-            .catch(error => console.error('Error fetching pause state:', error));
-    }, 100);
+        });
+    }
+
+    autoSolveCheckbox.addEventListener('change', sendAutoSolve);
+    autoSolveRateSelect.addEventListener('change', sendAutoSolve);
 
     const gainSelect = document.getElementById('gain_select');
     const exposureSelect = document.getElementById('exposure_select');
@@ -83,6 +187,7 @@ document.addEventListener('DOMContentLoaded', (event) => {
     const saveSettingsButton = document.getElementById('save_settings_button');
     const zoomSelect = document.getElementById('zoom_select');
     const testModeCheckbox = document.getElementById('test_mode_checkbox');
+    const trackingModeCheckbox = document.getElementById('tracking_mode_checkbox');
 
     // Hardcoded sensor dimensions
     const sensorWidth = 1456;
@@ -192,7 +297,7 @@ document.addEventListener('DOMContentLoaded', (event) => {
                 pauseButton.innerText = 'Resume';
             } else {
                 pauseButton.innerText = 'Pause';
-                if (currentVideoMode === 'solved' && !isSolving) {
+                if (currentVideoMode === 'solved' && !isSolving && !autoSolveCheckbox.checked) {
                     solveField();
                 }
             }
@@ -250,58 +355,49 @@ document.addEventListener('DOMContentLoaded', (event) => {
         });
     });
 
-    let solveStatusPollInterval;
-
-    function pollSolveStatus() {
-        fetch('/solve_status')
-            .then(response => response.json())
-            .then(data => {
-                if (data.status === 'solved') {
-                    raDisplay.innerText = data.ra_hms;
-                    decDisplay.innerText = data.dec_dms;
-                    altDisplay.innerText = data.alt;
-                    azDisplay.innerText = data.az;
-                    videoModeOverlay.innerText = 'SOLVE';
-                    videoModeOverlay.classList.remove('solve-fail');
-                    videoModeOverlay.classList.add('solve-success');
-                    matchedStarsOverlay.innerText = data.matched_stars_count + ' stars';
-                    matchedStarsOverlay.style.display = 'block'; // Show the overlay
-                    clearInterval(solveStatusPollInterval);
-                    isSolving = false; // Reset flag
-                    if (currentVideoMode === 'solved') {
-                        solveField();
-                    }
-                } else if (data.status === 'failed') {
-                    raDisplay.innerText = '--:--:--.-';
-                    decDisplay.innerText = '--:--:--.-';
-                    altDisplay.innerText = '--.-';
-                    azDisplay.innerText = '--.-';
-                    videoModeOverlay.innerText = 'FAIL';
-                    videoModeOverlay.classList.remove('solve-success');
-                    videoModeOverlay.classList.add('solve-fail');
-                    matchedStarsOverlay.innerText = '';
-                    matchedStarsOverlay.style.display = 'none'; // Hide the overlay
-                    clearInterval(solveStatusPollInterval);
-                    isSolving = false; // Reset flag
-                    if (currentVideoMode === 'solved') {
-                        solveField();
-                    }
-                } else if (data.status === 'paused') {
-                    clearInterval(solveStatusPollInterval);
-                    isSolving = false; // Reset flag
-                } else {
-                }
-            })
-            .catch(error => {
-                console.error('Error fetching solver status:', error);
-                clearInterval(solveStatusPollInterval);
-            });
+    function handleSolveStatus(status) {
+        const data = {status: status.solver_status, ...status.solver_result};
+        if (data.status === 'paused') {
+            isSolving = false; // Reset flag
+            return;
+        }
+        if (data.solve_id === undefined || data.solve_id === shownSolveId) {
+            return; // Nothing new
+        }
+        if (isSolving && solveIdAtRequest !== null && data.solve_id <= solveIdAtRequest) {
+            return; // Not a result of a solve started after we asked for one
+        }
+        shownSolveId = data.solve_id;
+        if (data.status === 'solved') {
+            raDisplay.innerText = data.ra_hms;
+            decDisplay.innerText = data.dec_dms;
+            altDisplay.innerText = data.alt;
+            azDisplay.innerText = data.az;
+            videoModeOverlay.innerText = 'SOLVE';
+            videoModeOverlay.classList.remove('solve-fail');
+            videoModeOverlay.classList.add('solve-success');
+            matchedStarsOverlay.innerText = data.matched_stars_count + ' stars';
+            matchedStarsOverlay.style.display = 'block'; // Show the overlay
+            isSolving = false; // Reset flag
+        } else if (data.status === 'failed') {
+            raDisplay.innerText = '--:--:--.-';
+            decDisplay.innerText = '--:--:--.-';
+            altDisplay.innerText = '--.-';
+            azDisplay.innerText = '--.-';
+            videoModeOverlay.innerText = 'FAIL';
+            videoModeOverlay.classList.remove('solve-success');
+            videoModeOverlay.classList.add('solve-fail');
+            matchedStarsOverlay.innerText = '';
+            matchedStarsOverlay.style.display = 'none'; // Hide the overlay
+            isSolving = false; // Reset flag
+        }
     }
 
     function solveField() {
         if (isSolving) return; // Prevent multiple solves
 
         isSolving = true; // Set flag
+        solveIdAtRequest = latestStatus ? latestStatus.solve_id : null;
 
         fetch('/solve', {
             method: 'POST'
@@ -309,8 +405,7 @@ document.addEventListener('DOMContentLoaded', (event) => {
         .then(response => response.json())
         .then(data => {
             if (data.status === 'solving') {
-                // Start polling for status
-                solveStatusPollInterval = setInterval(pollSolveStatus, 200);
+                // The result arrives through the /events stream
             } else {
                 isSolving = false; // Reset flag on failure to start
             }
@@ -337,27 +432,24 @@ document.addEventListener('DOMContentLoaded', (event) => {
 
     testModeCheckbox.addEventListener('change', sendTestMode);
 
+    function sendTrackingMode() {
+        fetch('/set_tracking_mode', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ tracking_mode: trackingModeCheckbox.checked })
+        });
+    }
+
+    trackingModeCheckbox.addEventListener('change', sendTrackingMode);
+
     // Send initial control values to the backend and update display when the page loads
     sendControls();
     updateVideoModeOverlay(); // Set initial overlay text
 
 
 
-    function updateSystemStats() {
-        fetch('/system-stats')
-            .then(response => response.json())
-            .then(data => {
-                document.getElementById('cpu-temp').innerText = data.cpu_temp;
-                document.getElementById('cpu-load').innerText = data.cpu_load;
-            })
-            .catch(error => console.error('Error fetching system stats:', error));
-    }
-
-    // Fetch system stats every 5 seconds
-    setInterval(updateSystemStats, 15000);
-    // Initial call to populate system stats
-    updateSystemStats();
-
     const darkModeToggle = document.getElementById('dark_mode_toggle');
 
     function applyDarkMode(darkMode) {
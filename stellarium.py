@@ -0,0 +1,122 @@
+# Stellarium pointing
+#
+# Points Stellarium's view (its Remote Control plugin) at each solved field.
+# Solves never wait for it: publish() only records the newest pose, and a
+# background thread sends whatever is newest when it is next free, at most
+# max_rate times a second, over one keep-alive connection.  Poses that
+# arrive while a push is in flight or rate limited are replaced, not queued,
+# so a slow or missing Stellarium costs one thread and nothing else.
+#
+#   [stellarium]
+#   url = http://192.168.1.139:8090
+#   ; pushes per second
+#   max_rate = 2
+#   ; seconds
+#   timeout = 1.0
+
+import math
+import threading
+import time
+
+import requests
+
+import metrics
+
+# After a failure, wait this long before the next try, doubling up to MAX_BACKOFF
+MIN_BACKOFF = 1.0
+MAX_BACKOFF = 30.0
+
+pushes = metrics.Counter("findr_stellarium_pushes_total",
+                         "Poses sent to Stellarium, by result", ["result"])
+push_time = metrics.Histogram("findr_stellarium_push_seconds",
+                              "Time for Stellarium to answer a pose")
+
+
+def view_vector(ra_radians, dec_radians):
+    """J2000 unit vector for Stellarium's /api/main/view."""
+    return [math.cos(dec_radians) * math.cos(ra_radians),
+            math.cos(dec_radians) * math.sin(ra_radians),
+            math.sin(dec_radians)]
+
+
+class StellariumPublisher:
+    """Sends the newest pose to Stellarium from a background thread."""
+    def __init__(self, url, max_rate=2.0, timeout=1.0):
+        self.endpoint = f"{url.rstrip('/')}/api/main/view"
+        self.interval = 1.0 / max_rate if max_rate > 0 else 0.0
+        self.timeout = timeout
+        self.session = requests.Session()
+        self._cond = threading.Condition()
+        self._pending = None
+        self._thread = None
+        self.sent = 0
+        self.failed = 0
+        self.coalesced = 0
+        self.last_error = None
+        self.last_sent = None
+        self.last_latency = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="stellarium", daemon=True)
+            self._thread.start()
+
+    def publish(self, ra_radians, dec_radians):
+        """Queue a pose, replacing any not yet sent; never blocks."""
+        with self._cond:
+            if self._pending is not None:
+                self.coalesced += 1
+                pushes.labels(result="coalesced").inc()
+            self._pending = (ra_radians, dec_radians)
+            self._cond.notify()
+
+    def _run(self):
+        next_time = 0.0
+        backoff = MIN_BACKOFF
+        while True:
+            with self._cond:
+                while self._pending is None:
+                    self._cond.wait()
+            # Let more poses arrive (and replace this one) until we may send
+            wait = next_time - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            with self._cond:
+                pose, self._pending = self._pending, None
+            started = time.monotonic()
+            if self._push(*pose):
+                backoff = MIN_BACKOFF
+                next_time = started + self.interval
+            else:
+                next_time = time.monotonic() + backoff
+                backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def _push(self, ra_radians, dec_radians):
+        params = {'j2000': str(view_vector(ra_radians, dec_radians))}
+        t0 = time.perf_counter()
+        try:
+            response = self.session.post(self.endpoint, data=params, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            self.failed += 1
+            self.last_error = str(e)
+            pushes.labels(result="error").inc()
+            return False
+        elapsed = time.perf_counter() - t0
+        push_time.observe(elapsed)
+        self.sent += 1
+        self.last_sent = time.time()
+        self.last_latency = round(elapsed, 4)
+        pushes.labels(result="ok").inc()
+        return True
+
+    def stats(self):
+        return {
+            "endpoint": self.endpoint,
+            "sent": self.sent,
+            "failed": self.failed,
+            "coalesced": self.coalesced,
+            "last_error": self.last_error,
+            "last_sent": self.last_sent,
+            "last_latency": self.last_latency,
+        }
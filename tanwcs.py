@@ -0,0 +1,205 @@
+# Gnomonic (TAN) world coordinates, with optional SIP distortion
+#
+# A small stand-in for astropy's fit_wcs_from_points(projection='TAN',
+# sip_degree=...).  Instead of an iterative fit over SkyCoord objects, we
+# project the matched stars onto the tangent plane at their mean direction
+# and fit pixel -> plane as one linear least-squares polynomial.  Its linear
+# part is the CD matrix, and the higher orders are the SIP A/B terms.
+#
+# Pixel coordinates are whatever the fit was given (tetra3's centroids), and
+# RA/Dec are in degrees.  Run `python tanwcs.py` to compare against astropy
+# on the test images; that is the only thing here that needs astropy.
+
+import math
+
+import numpy as np
+
+from boundaries import radec_to_xyz
+
+
+def _monomials(u, v, degree, lowest=0):
+    """Rows u^p v^q for lowest <= p+q <= degree, in a fixed order."""
+    return np.array([u ** (n - q) * v ** q
+                     for n in range(lowest, degree + 1) for q in range(n + 1)])
+
+
+class TanWCS:
+    """A fitted TAN(+SIP) projection.
+
+    `crval` is the tangent point (RA, Dec), which lands on pixel `crpix`.
+    `cd` maps pixel offsets to degrees on the tangent plane, after the SIP
+    terms `sip` (2 x terms, orders 2..sip_degree) have been added to them.
+    """
+    def __init__(self, crval, crpix, cd, sip=None, sip_degree=0):
+        self.crval = np.asarray(crval, dtype=np.float64)
+        self.crpix = np.asarray(crpix, dtype=np.float64)
+        self.cd = np.asarray(cd, dtype=np.float64)
+        self.cd_inv = np.linalg.inv(self.cd)
+        self.sip = None if sip is None else np.asarray(sip, dtype=np.float64)
+        self.sip_degree = sip_degree if self.sip is not None else 0
+
+        # Tangent point and the east/north directions there
+        ra, dec = np.radians(self.crval)
+        self._centre = radec_to_xyz(*self.crval)
+        self._east = np.array([-math.sin(ra), math.cos(ra), 0.0])
+        self._north = np.array([-math.sin(dec) * math.cos(ra),
+                                -math.sin(dec) * math.sin(ra), math.cos(dec)])
+
+    def _distortion(self, u, v):
+        return self.sip @ _monomials(u, v, self.sip_degree, lowest=2)
+
+    def plane_from_world(self, ra, dec):
+        """Project RA/Dec onto the tangent plane; (xi, eta) in degrees.
+
+        Points more than 90 degrees from the tangent point come back as NaN.
+        """
+        xyz = radec_to_xyz(ra, dec)
+        cos_c = xyz @ self._centre
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(cos_c > 0, np.degrees(1.0) / cos_c, np.nan)
+        return xyz @ self._east * scale, xyz @ self._north * scale
+
+    def world_from_plane(self, xi, eta):
+        xyz = (self._centre + np.radians(np.multiply.outer(xi, self._east))
+               + np.radians(np.multiply.outer(eta, self._north)))
+        ra = np.degrees(np.arctan2(xyz[..., 1], xyz[..., 0])) % 360
+        dec = np.degrees(np.arctan2(xyz[..., 2], np.hypot(xyz[..., 0], xyz[..., 1])))
+        return ra, dec
+
+    def pixel_to_world(self, x, y):
+        """Return (ra, dec) arrays in degrees for pixel coordinates."""
+        u = np.asarray(x, dtype=np.float64) - self.crpix[0]
+        v = np.asarray(y, dtype=np.float64) - self.crpix[1]
+        if self.sip is not None:
+            du, dv = self._distortion(u, v)
+            u, v = u + du, v + dv
+        xi, eta = self.cd @ np.array([u, v])
+        return self.world_from_plane(xi, eta)
+
+    def world_to_pixel(self, ra, dec, iterations=10):
+        """Return (x, y) pixel arrays for RA/Dec in degrees.
+
+        The SIP terms are inverted by fixed-point iteration, which converges
+        quickly for the small distortions of a finder lens.
+        """
+        xi, eta = self.plane_from_world(ra, dec)
+        big_u, big_v = self.cd_inv @ np.array([xi, eta])
+        u, v = big_u, big_v
+        if self.sip is not None:
+            for _ in range(iterations):
+                du, dv = self._distortion(u, v)
+                u, v = big_u - du, big_v - dv
+        return u + self.crpix[0], v + self.crpix[1]
+
+
+def fit(x, y, ra, dec, sip_degree=2, crpix=None):
+    """Fit a TanWCS to matched pixel and RA/Dec (degrees) positions.
+
+    Needs at least three stars, and drops to a plain TAN fit when there are
+    too few for the SIP terms.  `crpix` defaults to the middle of the stars.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if len(x) < 3:
+        raise ValueError("need at least three stars to fit a WCS")
+    while sip_degree >= 2 and len(x) < 2 * len(_monomials(0.0, 0.0, sip_degree)):
+        sip_degree -= 1
+    if sip_degree < 2:
+        sip_degree = 1
+
+    # Tangent point at the mean direction of the stars
+    centre = radec_to_xyz(ra, dec).sum(axis=0)
+    crval = (math.degrees(math.atan2(centre[1], centre[0])) % 360,
+             math.degrees(math.atan2(centre[2], math.hypot(centre[0], centre[1]))))
+    plane = TanWCS(crval, (0, 0), np.eye(2))
+    xi, eta = plane.plane_from_world(ra, dec)
+
+    if crpix is None:
+        crpix = ((x.min() + x.max()) / 2, (y.min() + y.max()) / 2)
+    crpix = np.array(crpix, dtype=np.float64)
+
+    # Fit plane = P(pixel - crpix) with a constant term, then move crpix to
+    # where P is zero so the tangent point lands on it; a couple of rounds
+    # settle it when there are SIP terms.
+    for _ in range(3):
+        u, v = x - crpix[0], y - crpix[1]
+        scale = 1.0 / max(np.abs(u).max(), np.abs(v).max(), 1.0)
+        terms = _monomials(u * scale, v * scale, sip_degree)
+        coeffs, *_ = np.linalg.lstsq(terms.T, np.column_stack([xi, eta]), rcond=None)
+        # Undo the scaling: coefficient of an order-n term gets scale**n
+        orders = np.concatenate([[n] * (n + 1) for n in range(sip_degree + 1)])
+        coeffs = coeffs.T * scale ** orders
+        cd = coeffs[:, 1:3]
+        shift = np.linalg.solve(cd, coeffs[:, 0])
+        crpix = crpix - shift
+        if np.hypot(*shift) < 1e-6:
+            break
+
+    sip = np.linalg.solve(cd, coeffs[:, 3:]) if sip_degree >= 2 else None
+    return TanWCS(crval, crpix, cd, sip, sip_degree)
+
+
+def fit_solution(solution, sip_degree=2):
+    """Fit a TanWCS to a tetra3 solution's matched stars."""
+    centroids = np.asarray(solution["matched_centroids"], dtype=np.float64)
+    stars = np.asarray(solution["matched_stars"], dtype=np.float64)
+    # tetra3 gives centroids as (y, x)
+    return fit(centroids[:, 1], centroids[:, 0], stars[:, 0], stars[:, 1], sip_degree)
+
+
+if __name__ == '__main__':
+    # Accuracy and speed against astropy's fit_wcs_from_points, on the
+    # stars tetra3 matches in each test image.
+    import os
+    import sys
+    import time
+    from PIL import Image
+    # tetra3 needs this, see solver.py
+    np.math = math
+    import tetra3
+    from astropy import units
+    from astropy.coordinates import SkyCoord
+    from astropy.wcs.utils import fit_wcs_from_points
+
+    images_dir = sys.argv[1] if len(sys.argv) > 1 else "test-images"
+    tetra = tetra3.Tetra3()
+    print(f"{'image':42} {'stars':>5} {'astropy ms':>10} {'ours ms':>8} "
+          f"{'res arcsec':>10} {'astropy res':>11} {'max diff px':>11}")
+    for name in sorted(os.listdir(images_dir)):
+        if not name.lower().endswith(('.jpg', '.jpeg')):
+            continue
+        image = np.asarray(Image.open(os.path.join(images_dir, name)).convert('L'))
+        centroids = tetra3.get_centroids_from_image(image)
+        solution = tetra.solve_from_centroids(centroids, image.shape, return_matches=True,
+                                              distortion=-0.003857906866170312)
+        if solution.get('RA') is None:
+            print(f"{name:42} not solved")
+            continue
+        xy = np.asarray(solution["matched_centroids"])[:, ::-1]
+        stars = np.asarray(solution["matched_stars"])
+
+        t0 = time.perf_counter()
+        ours = fit_solution(solution)
+        t_ours = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        theirs = fit_wcs_from_points((xy[:, 0], xy[:, 1]),
+                                     SkyCoord(ra=stars[:, 0] * units.deg, dec=stars[:, 1] * units.deg),
+                                     projection='TAN', sip_degree=2)
+        t_theirs = (time.perf_counter() - t0) * 1000
+
+        def residual(ra, dec):
+            # RMS distance (arcsec) from the catalog positions
+            cos_d = np.clip(np.sum(radec_to_xyz(ra, dec) * radec_to_xyz(stars[:, 0], stars[:, 1]), axis=-1), -1, 1)
+            return math.degrees(math.sqrt(np.mean(np.arccos(cos_d) ** 2))) * 3600
+
+        res_ours = residual(*ours.pixel_to_world(xy[:, 0], xy[:, 1]))
+        res_theirs = residual(*theirs.pixel_to_world_values(xy[:, 0], xy[:, 1]))
+
+        # Compare the two over a grid covering the frame
+        h, w = image.shape
+        gx, gy = np.meshgrid(np.linspace(0, w, 9), np.linspace(0, h, 7))
+        ra, dec = theirs.pixel_to_world_values(gx.ravel(), gy.ravel())
+        px, py = ours.world_to_pixel(ra, dec)
+        diff = np.hypot(px - gx.ravel(), py - gy.ravel()).max()
+        print(f"{name:42} {len(stars):5} {t_theirs:10.2f} {t_ours:8.2f} "
+              f"{res_ours:10.1f} {res_theirs:11.1f} {diff:11.3f}")
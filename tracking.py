@@ -0,0 +1,179 @@
+# Tracking: solve a frame from a nearby, known pointing
+#
+# A full tetra3 solve is a lost-in-space pattern search over the whole sky.
+# When the telescope has only moved a little since the last solve we can do
+# much less: project the catalog stars around the last pointing into the
+# image, pair them with the new centroids by nearest neighbour, and refit
+# the attitude from those pairs.  The camera model (pinhole plus radial
+# distortion) and the RA/Dec/Roll conventions are tetra3's, so a tracked
+# solution looks just like one from tetra3 and can seed the next frame.
+
+import math
+import time
+
+import numpy as np
+
+
+def compute_vectors(centroids, size, fov):
+    """Turn (y, x) centroids into camera-frame unit vectors (x is boresight)."""
+    height, width = size
+    scale = math.tan(fov / 2) / width * 2
+    vectors = np.ones((len(centroids), 3))
+    vectors[:, 2:0:-1] = (np.array([height / 2, width / 2]) - centroids) * scale
+    return vectors / np.linalg.norm(vectors, axis=1)[:, None]
+
+
+def compute_centroids(vectors, size, fov):
+    """Project camera-frame unit vectors back to (y, x) centroids."""
+    height, width = size
+    scale = -width / 2 / math.tan(fov / 2)
+    return scale * vectors[:, 2:0:-1] / vectors[:, [0]] + [height / 2, width / 2]
+
+
+def undistort_centroids(centroids, size, k):
+    """Remove tetra3's radial distortion k (at width/2) from (y, x) centroids."""
+    height, width = size
+    centre = np.array([height / 2, width / 2])
+    offset = centroids - centre
+    scale = (1 - k * (np.linalg.norm(offset, axis=1) / width * 2) ** 2) / (1 - k)
+    return offset * scale[:, None] + centre
+
+
+def find_rotation_matrix(image_vectors, catalog_vectors):
+    """Least squares rotation taking catalog vectors to image vectors."""
+    u, _, v = np.linalg.svd(image_vectors.T @ catalog_vectors)
+    return u @ v
+
+
+def attitude(rotation_matrix):
+    """Return (RA, Dec, Roll) in degrees for a rotation matrix."""
+    r = rotation_matrix
+    ra = math.degrees(math.atan2(r[0, 1], r[0, 0])) % 360
+    dec = math.degrees(math.atan2(r[0, 2], np.linalg.norm(r[1:3, 2])))
+    roll = math.degrees(math.atan2(r[1, 2], r[2, 2])) % 360
+    return ra, dec, roll
+
+
+def radec_to_vectors(radec):
+    """Unit vectors for an (N, 2+) array of RA/Dec in degrees."""
+    ra = np.radians(radec[:, 0])
+    dec = np.radians(radec[:, 1])
+    return np.column_stack([np.cos(ra) * np.cos(dec), np.sin(ra) * np.cos(dec), np.sin(dec)])
+
+
+def match_nearest(image, predicted, radius):
+    """Pair up points that are each other's nearest neighbour within radius.
+
+    Returns (image indices, predicted indices).
+    """
+    dist = ((image[:, None, :] - predicted[None, :, :]) ** 2).sum(axis=2)
+    nearest = dist.argmin(axis=1)
+    mutual = dist.argmin(axis=0)[nearest] == np.arange(len(image))
+    close = dist[np.arange(len(image)), nearest] < radius ** 2
+    keep = np.flatnonzero(mutual & close)
+    return keep, nearest[keep]
+
+
+def estimate_shift(image, predicted, max_shift, bin_size):
+    """Find the common (dy, dx) offset between two point sets.
+
+    Every pairing within max_shift votes for its offset; the true one gets
+    a vote from nearly every star, the wrong ones are spread out.
+    """
+    offsets = (image[:, None, :] - predicted[None, :, :]).reshape(-1, 2)
+    offsets = offsets[np.all(np.abs(offsets) < max_shift, axis=1)]
+    if not len(offsets):
+        return None
+    nbins = int(2 * max_shift // bin_size) + 1
+    bins = ((offsets + max_shift) // bin_size).astype(np.int64)
+    votes = np.bincount(bins[:, 0] * nbins + bins[:, 1], minlength=nbins * nbins)
+    best = votes.argmax()
+    centre = (np.array([best // nbins, best % nbins]) + 0.5) * bin_size - max_shift
+    return np.median(offsets[np.all(np.abs(offsets - centre) < bin_size, axis=1)], axis=0)
+
+
+def track(centroids, size, seed, star_table, star_ids=None, distortion=0.0,
+          max_shift=0.25, match_radius=0.01, min_matches=6, min_fraction=0.3,
+          max_stars=50):
+    """Solve centroids by tracking from `seed`, a recent solution.
+
+    `seed` must have the FOV and matched stars of a tetra3 (or tracked)
+    solution.  `star_table` is tetra3's (ra, dec, x, y, z, mag) star table,
+    brightest first.  The field may have moved by up to `max_shift` of its
+    width since the seed; `match_radius` is also a fraction of the width.
+    A match needs `min_matches` stars, and `min_fraction` of the stars we
+    expected to see, so a few chance pairings can't pass for a lock.
+    Only the `max_stars` brightest centroids are used to find the match;
+    the final pairing then uses all of them.
+
+    Returns a tetra3-style solution dict, or None if too few stars match,
+    in which case the caller should fall back to a full solve.
+    """
+    t0 = time.perf_counter()
+    height, width = size
+    seed_centroids = np.asarray(seed.get('matched_centroids') or [], dtype=np.float64)
+    seed_stars = np.asarray(seed.get('matched_stars') or [], dtype=np.float64)
+    if len(seed_centroids) < 3 or len(centroids) < min_matches or not seed.get('FOV'):
+        return None
+    fov = math.radians(seed['FOV'])
+    k = seed.get('distortion')
+    if k is None:
+        k = distortion
+
+    # Where the seed was pointing, from its own matches
+    rotation = find_rotation_matrix(
+        compute_vectors(undistort_centroids(seed_centroids, size, k), size, fov),
+        radec_to_vectors(seed_stars))
+
+    # Catalog stars that could be in the field if it has moved by max_shift
+    radius = fov / 2 * math.hypot(width, height) / width + max_shift * fov
+    nearby = np.flatnonzero(star_table[:, 2:5] @ rotation[0] > math.cos(radius))
+    nearby = nearby[:4 * max(len(centroids), max_stars)]
+    if len(nearby) < min_matches:
+        return None
+    star_vectors = star_table[nearby, 2:5]
+
+    image = undistort_centroids(np.asarray(centroids, dtype=np.float64), size, k)
+    image_vectors = compute_vectors(image, size, fov)
+
+    # Coarse pass: find how far the field has moved, then pair stars up
+    # and refit, tightening the match radius as the attitude improves.
+    # tetra3 sorts centroids brightest first, so these are the brightest.
+    bright = image[:max_stars]
+    bright_stars = star_vectors[:4 * max_stars]
+    predicted = compute_centroids(bright_stars @ rotation.T, size, fov)
+    shift = estimate_shift(bright, predicted, max_shift * width, 4 * match_radius * width)
+    if shift is None:
+        return None
+    predicted += shift
+    for radius in (4 * match_radius, 2 * match_radius, match_radius):
+        i, j = match_nearest(bright, predicted, radius * width)
+        if len(i) < min_matches:
+            return None
+        rotation = find_rotation_matrix(image_vectors[i], bright_stars[j])
+        predicted = compute_centroids(bright_stars @ rotation.T, size, fov)
+
+    # Final pass over everything, and one more refit
+    predicted = compute_centroids(star_vectors @ rotation.T, size, fov)
+    i, j = match_nearest(image, predicted, match_radius * width)
+    in_frame = np.count_nonzero(np.all((predicted > 0) & (predicted < size), axis=1))
+    if len(i) < max(min_matches, min_fraction * min(len(image), in_frame)):
+        return None
+    rotation = find_rotation_matrix(image_vectors[i], star_vectors[j])
+
+    ra, dec, roll = attitude(rotation)
+    residual = np.linalg.norm(image_vectors[i] @ rotation - star_vectors[j], axis=1)
+    stars = star_table[nearby[j]][:, [0, 1, 5]]
+    stars[:, :2] = np.degrees(stars[:, :2])
+    solution = {
+        'RA': ra, 'Dec': dec, 'Roll': roll,
+        'FOV': seed['FOV'], 'distortion': k,
+        'RMSE': math.degrees(math.sqrt(np.mean(residual ** 2))) * 3600,
+        'Matches': len(i),
+        'matched_centroids': np.asarray(centroids)[i].tolist(),
+        'matched_stars': stars.tolist(),
+        'matched_catID': None if star_ids is None else star_ids[nearby[j]].tolist(),
+        'tracked': True,
+    }
+    solution['T_solve'] = (time.perf_counter() - t0) * 1000
+    return solution